@@ -12,7 +12,7 @@ prefer clear UI wording.
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from pathlib import Path
-from par_core.service import process_file
+from par_core.service import process_file, process_files
 from par_core.db import export_chain_html
 
 class App(tk.Tk):
@@ -69,14 +69,17 @@ class App(tk.Tk):
         out = Path(folder) / "sanitized"
         out.mkdir(exist_ok=True)
         count = 0
-        for p in Path(folder).glob("**/*"):
-            if p.is_file() and p.suffix.lower() in {".txt",".md",".csv",".log",".json"}:
-                try:
-                    res = process_file(p, user=self.user.get(), strategy=self.strategy.get())
-                    (out / p.name).write_text(res["redacted"], encoding="utf-8")
-                    count += 1
-                except Exception as e:
-                    print(f"[BatchError] {p}: {e}")
+        files = (p for p in Path(folder).glob("**/*") if p.is_file() and p.suffix.lower() in {".txt",".md",".csv",".log",".json"})
+        for p, res in process_files(files, user=self.user.get(), strategy=self.strategy.get(), skip_errors=True, result="lean"):
+            if "error" in res:
+                print(f"[BatchError] {p}: {res['error']}")
+                continue
+            try:
+                (out / p.name).write_text(res["redacted"], encoding="utf-8")
+            except Exception as e:
+                print(f"[BatchError] {p}: {e}")
+                continue
+            count += 1
         messagebox.showinfo("批量完成", f"共处理 {count} 个文件；输出：{out}")
 
     def export_report(self):
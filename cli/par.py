@@ -8,27 +8,64 @@ familiar to sysadmins.
 # Human note: example invocation in docs/README.md
 
 
-import argparse, sys
+import argparse, json, sys
 from pathlib import Path
-from par_core.service import process_file
-from par_core.db import export_chain_html, export_chain_html_with_stats
+from par_core.service import Redactor
+from par_core.cache import ResultCache
+from par_core.batch import redact_parallel
+from par_core.pipeline import run_pipeline
+from par_core.db import AuditWriter, export_chain_html, export_chain_html_with_stats, verify_chain, query_operations, prune_snapshots, gc_blobs, train_zdict, CODECS
+from par_core.utils.metrics import PLUGIN_METRICS
+from par_core.utils.pool import DEFAULT_TIMEOUT
+from par_core.bench import bench_db, stress_appends, bench_codecs
 
 def cmd_redact(args):
+    # the result cache and incremental rescans live in Redactor; the worker pool and the pipeline bypass it
+    if (args.cache or args.incremental) and (args.jobs > 1 or args.dedupe or args.pipeline):
+        args.parser.error("--cache and --incremental run in serial mode only; drop --jobs/--dedupe/--pipeline")
+    if args.plugin_budget is not None:
+        PLUGIN_METRICS.configure(args.plugin_budget, args.budget_policy)
+    audit = AuditWriter(durability=args.durability, backend=args.snapshots, codec=args.codec)
     p = Path(args.input)
     out = Path(args.output)
+    plugins_dir = Path(args.plugins) if args.plugins else None
     out.mkdir(exist_ok=True, parents=True)
+    def redactor():
+        cache = ResultCache(reuse_audit=args.reuse_audit) if args.cache else None
+        return Redactor(args.strategy, plugins_dir, args.plugin_mode, args.plugin_timeout, audit=audit, user=args.user, cache=cache,
+                        incremental=args.incremental, prepare=args.prepare)
     if p.is_file():
-        res = process_file(p, user=args.user, strategy=args.strategy)
+        res = redactor().process_file(p)
         (out / p.name).write_text(res["redacted"], encoding="utf-8")
         print(f"[OK] {p} -> {out/p.name} findings={len(res['findings'])} op_id={res['op_id']}")
     else:
         total = 0
-        for f in p.glob("**/*"):
-            if f.is_file() and f.suffix.lower() in {".txt",".md",".csv",".log",".json"}:
-                res = process_file(f, user=args.user, strategy=args.strategy)
+        files = (f for f in p.glob("**/*") if f.is_file() and f.suffix.lower() in {".txt",".md",".csv",".log",".json"})
+        if args.pipeline:
+            items = ((f, out / f.name) for f in files)
+            report = run_pipeline(items, jobs=args.jobs if args.jobs > 1 else None, user=args.user, strategy=args.strategy,
+                                  plugins_dir=plugins_dir, plugin_mode=args.plugin_mode, plugin_timeout=args.plugin_timeout,
+                                  commit_every=args.commit_every, audit=audit, prepare=args.prepare,
+                                  report_every=5.0, on_report=lambda r: print(f"[PIPELINE] {json.dumps(r['stages'])}"))
+            total = report["stages"]["audit"]["items"]
+            print(f"[PIPELINE] {json.dumps(report, ensure_ascii=False)}")
+        elif args.jobs > 1 or args.dedupe:
+            # workers write the outputs; this process only appends the audit chain
+            items = ((f, out / f.name) for f in files)
+            for f, res in redact_parallel(items, args.jobs, user=args.user, strategy=args.strategy, plugins_dir=plugins_dir,
+                                          plugin_mode=args.plugin_mode, order=args.order, commit_every=args.commit_every, audit=audit,
+                                          schedule=args.schedule, shard_bytes=int(args.shard_mb * 1024 * 1024) if args.shard_mb else None,
+                                          dedupe=args.dedupe, plugin_timeout=args.plugin_timeout, prepare=args.prepare):
+                total += 1
+        else:
+            # only the redacted text is written out: skip diffs and finding copies
+            for f, res in redactor().process_many(files, commit_every=args.commit_every, result="lean"):
                 (out / f.name).write_text(res["redacted"], encoding="utf-8")
                 total += 1
         print(f"[BATCH] processed={total} -> {out}")
+    audit.close()
+    if args.metrics:
+        print(f"[METRICS] {PLUGIN_METRICS.export_json(args.metrics)}")
 
 def cmd_report(args):
     dest = Path(args.output)
@@ -36,6 +73,40 @@ def cmd_report(args):
     export_chain_html(dest)
     print(f"[REPORT] {dest}")
 
+def cmd_bench_db(args):
+    print(f"[BENCH] {json.dumps(bench_db(args.ops, args.size))}")
+
+def cmd_bench_codecs(args):
+    res = bench_codecs([Path(p) for p in args.input] if args.input else None, limit=args.limit)
+    print(f"[BENCH] {json.dumps(res)}")
+
+def cmd_train_zdict(args):
+    dict_id = train_zdict(samples=args.samples)
+    print(f"[ZDICT] id={dict_id}" if dict_id is not None else "[ZDICT] no shared text in the sampled snapshots")
+
+def cmd_stress_db(args):
+    res = stress_appends(args.db, args.writers, args.ops, args.group)
+    print(f"[STRESS] {json.dumps(res, ensure_ascii=False)}")
+    return 0 if res["ok"] and res["count"] == res["expected"] else 1
+
+def cmd_query(args):
+    page, cursor = query_operations(file_path=args.file, user=args.user, action=args.action, before_hash=args.before_hash,
+                                    since=args.since, until=args.until, cursor=args.cursor, limit=args.limit)
+    for op in page:
+        print(json.dumps(op, ensure_ascii=False))
+    if cursor is not None:
+        print(f"[NEXT] --cursor {cursor}")
+
+def cmd_verify(args):
+    res = verify_chain()
+    print(f"[VERIFY] {json.dumps(res, ensure_ascii=False)}")
+    return 0 if res["ok"] else 1
+
+def cmd_gc(args):
+    if args.prune_before is not None:
+        print(f"[PRUNE] snapshots={prune_snapshots(args.prune_before)}")
+    print(f"[GC] {json.dumps(gc_blobs(keep_latest_zdict=not args.drop_zdicts))}")
+
 def build_parser():
     ap = argparse.ArgumentParser(prog="par", description="PrivAuditRedactor CLI")
     sp = ap.add_subparsers()
@@ -45,7 +116,28 @@ def build_parser():
     ap_red.add_argument("--output", required=True)
     ap_red.add_argument("--user", default="cli")
     ap_red.add_argument("--strategy", default="smart", choices=["smart","full"])
-    ap_red.set_defaults(func=cmd_redact)
+    ap_red.add_argument("--plugins", help="plugin directory to load detectors/transformers from")
+    ap_red.add_argument("--plugin-mode", default="inproc", choices=["inproc","pool"], help="pool: run plugins in isolated worker processes")
+    ap_red.add_argument("--plugin-timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds per plugin call before a pool worker is restarted (--plugin-mode pool)")
+    ap_red.add_argument("--jobs", type=int, default=1, help="worker processes for folder mode")
+    ap_red.add_argument("--pipeline", action="store_true", help="asyncio staged pipeline (read/detect/write/audit) for folder mode")
+    ap_red.add_argument("--order", default="input", choices=["input","completion"], help="audit chain order with --jobs")
+    ap_red.add_argument("--schedule", default="fifo", choices=["fifo","lpt"], help="lpt: largest work first, huge files sharded (with --jobs)")
+    ap_red.add_argument("--shard-mb", type=float, help="split files larger than this into shards (lpt schedule)")
+    ap_red.add_argument("--commit-every", type=int, default=64, help="audit records per transaction in folder mode")
+    ap_red.add_argument("--dedupe", action="store_true", help="process byte-identical inputs once (folder mode, uses the worker pool)")
+    ap_red.add_argument("--cache", action="store_true", help="reuse stored results for unchanged inputs (single file or serial folder mode)")
+    ap_red.add_argument("--reuse-audit", default="light", choices=["light","none"], help="audit entry written for cache hits")
+    ap_red.add_argument("--incremental", action="store_true", help="rescan only the changed regions of files redacted before with the same settings (single file or serial folder mode)")
+    ap_red.add_argument("--durability", default="strict", choices=["strict","grouped"],
+                        help="grouped: write-behind audit commits shared by concurrent writers (see AuditWriter)")
+    ap_red.add_argument("--snapshots", default="blob", choices=["blob","chunked"], help="chunked: store large snapshots as shared content-defined chunks")
+    ap_red.add_argument("--codec", default="zlib", choices=sorted(CODECS), help="compression for new snapshots (zlib-dict: run train-zdict first)")
+    ap_red.add_argument("--prepare", action="store_true", help="hash and compress snapshots in threads ahead of each audit commit (multi-core)")
+    ap_red.add_argument("--metrics", help="write per-plugin latency/error metrics (JSON) to this path")
+    ap_red.add_argument("--plugin-budget", type=float, help="per-call plugin time budget in seconds")
+    ap_red.add_argument("--budget-policy", default="flag", choices=["flag","skip"])
+    ap_red.set_defaults(func=cmd_redact, parser=ap_red)
 
     ap_rep = sp.add_parser("report", help="Export audit chain HTML")
     ap_rep.add_argument("--output", required=True)
@@ -54,6 +146,46 @@ def build_parser():
     ap_rep_stat.add_argument('--output', required=True)
     ap_rep_stat.set_defaults(func=lambda args: export_chain_html_with_stats(args.output))
 
+    ap_bench = sp.add_parser("bench-db", help="Benchmark audit DB appends (ops/sec)")
+    ap_bench.add_argument("--ops", type=int, default=1000)
+    ap_bench.add_argument("--size", type=int, default=2048, help="bytes per snapshot")
+    ap_bench.set_defaults(func=cmd_bench_db)
+
+    ap_codecs = sp.add_parser("bench-codecs", help="Compare snapshot codecs (ratio, MB/s) on real data")
+    ap_codecs.add_argument("--input", nargs="*", help="files or folders to sample (default: snapshots in the audit DB)")
+    ap_codecs.add_argument("--limit", type=int, default=500, help="maximum number of samples")
+    ap_codecs.set_defaults(func=cmd_bench_codecs)
+
+    ap_zdict = sp.add_parser("train-zdict", help="Train a zlib preset dictionary on recent snapshots")
+    ap_zdict.add_argument("--samples", type=int, default=200)
+    ap_zdict.set_defaults(func=cmd_train_zdict)
+
+    ap_stress = sp.add_parser("stress-db", help="Append from N processes at once and verify the chain")
+    ap_stress.add_argument("--db", required=True, help="scratch DB file to write to")
+    ap_stress.add_argument("--writers", type=int, default=4)
+    ap_stress.add_argument("--ops", type=int, default=200, help="operations per writer")
+    ap_stress.add_argument("--group", type=int, default=1, help="operations per transaction")
+    ap_stress.set_defaults(func=cmd_stress_db)
+
+    ap_query = sp.add_parser("query", help="List audit operations (newest first, paginated)")
+    ap_query.add_argument("--file")
+    ap_query.add_argument("--user")
+    ap_query.add_argument("--action")
+    ap_query.add_argument("--before-hash")
+    ap_query.add_argument("--since", help="op_time lower bound (ISO, UTC)")
+    ap_query.add_argument("--until", help="op_time upper bound (ISO, UTC)")
+    ap_query.add_argument("--cursor", type=int, help="continue after this op id")
+    ap_query.add_argument("--limit", type=int, default=50)
+    ap_query.set_defaults(func=cmd_query)
+
+    ap_verify = sp.add_parser("verify", help="Verify the audit hash chain")
+    ap_verify.set_defaults(func=cmd_verify)
+
+    ap_gc = sp.add_parser("gc", help="Delete snapshot blobs no operation refers to")
+    ap_gc.add_argument("--prune-before", type=int, help="first drop the snapshots of operations with a smaller id")
+    ap_gc.add_argument("--drop-zdicts", action="store_true", help="also delete the newest compression dictionary when no blob uses it")
+    ap_gc.set_defaults(func=cmd_gc)
+
     return ap
 
 def main(argv=None):
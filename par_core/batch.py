@@ -0,0 +1,334 @@
+"""
+Parallel batch redaction.
+
+Detection, redaction and output writing fan out to a process pool; the parent
+process is the single audit writer and appends results to the hash chain in a
+deterministic order.
+
+Developer notes:
+- Workers are spawned (not forked) and build their own Redactor once in the
+  pool initializer, so plugin loading and rule compilation happen once per
+  worker rather than once per file. The initializer also applies the plugin
+  time budget; every job returns (result, drained plugin metrics) and the
+  parent merges the metrics into its PLUGIN_METRICS.
+- Only the texts needed for the audit snapshots travel back to the parent,
+  as a result dict tagged with `kind` ("file" or "shard").
+- `order="input"` chains records in input order (a reorder buffer of at most
+  4 results per job holds early finishers); `order="completion"` chains them
+  as they finish. Either way the input position is kept in meta as `seq`.
+- `schedule="lpt"` stats every input first and submits the most expensive
+  work first (longest-processing-time). With `order="input"`, once the
+  reorder buffer is full the oldest unfinished input is submitted next
+  instead, so the buffer stays bounded. Files larger than the shard size are
+  split at line boundaries into shards redacted by different workers and
+  stitched together by the parent, which then writes that output itself.
+  Rules that match across a line break are not seen across shard edges.
+- `dedupe=True` hashes all inputs up front in a thread pool; duplicates are
+  never submitted to the workers and get snapshot-less audit entries.
+- With `prepare=True` the parent hashes and compresses snapshots in the
+  audit writer's threads (`AuditWriter.prepare`) while it keeps collecting
+  worker results; otherwise that happens inside the commit.
+"""
+
+import hashlib, math, multiprocessing, time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from par_core.db import AuditWriter, throughput_by_suffix
+from par_core.utils.metrics import PLUGIN_METRICS
+from par_core.utils.pool import DEFAULT_TIMEOUT
+
+MIN_SHARD_BYTES = 4 * 1024 * 1024
+
+_WORKER = None
+
+
+def _init_worker(strategy: str, plugins_dir, plugin_mode: str, plugin_timeout: float=DEFAULT_TIMEOUT,
+                 time_budget: Optional[float]=None, budget_policy: str="flag"):
+    global _WORKER
+    from par_core.service import Redactor
+    PLUGIN_METRICS.configure(time_budget, budget_policy)
+    _WORKER = Redactor(strategy, Path(plugins_dir) if plugins_dir else None, plugin_mode, plugin_timeout)
+
+
+def _redact_job(seq: int, src: str, dest: str):
+    t0 = time.perf_counter()
+    text = Path(src).read_text(encoding="utf-8", errors="ignore")
+    (findings, redacted), = _WORKER.redact_many([text])
+    Path(dest).write_text(redacted, encoding="utf-8")
+    res = {"kind": "file", "seq": seq, "text": text, "findings": findings, "redacted": redacted, "elapsed": time.perf_counter() - t0}
+    return res, PLUGIN_METRICS.drain()
+
+
+def _redact_text_job(text: str):
+    (findings, redacted), = _WORKER.redact_many([text])
+    return (findings, redacted), PLUGIN_METRICS.drain()
+
+
+def read_shard(src: str, start: int, end: int) -> str:
+    """Text of the lines whose first byte lies in [start, end).
+
+    Shards of one file concatenate to `Path(src).read_text()`: newlines are
+    normalised the same way and a "\\n" byte never sits inside a UTF-8 sequence.
+    """
+    with open(src, "rb") as fh:
+        if start > 0:
+            fh.seek(start - 1)
+            fh.readline()  # skip the line that began before `start`
+        pos = fh.tell()
+        data = fh.read(end - pos) if pos < end else b""
+        if data and not data.endswith(b"\n"):
+            data += fh.readline()
+    return data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _redact_shard_job(seq: int, idx: int, src: str, start: int, end: int):
+    t0 = time.perf_counter()
+    text = read_shard(src, start, end)
+    (findings, redacted), = _WORKER.redact_many([text])
+    res = {"kind": "shard", "seq": seq, "shard": idx, "text": text, "findings": findings, "redacted": redacted,
+           "elapsed": time.perf_counter() - t0}
+    return res, PLUGIN_METRICS.drain()
+
+
+def make_process_pool(jobs: int, strategy: str="smart", plugins_dir: Path=None, plugin_mode: str="inproc",
+                      plugin_timeout: float=DEFAULT_TIMEOUT) -> ProcessPoolExecutor:
+    """Spawned worker pool whose processes each hold one Redactor.
+
+    Workers use the plugin time budget and policy PLUGIN_METRICS has here.
+    """
+    return ProcessPoolExecutor(max_workers=max(1, jobs), mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker, initargs=(strategy, str(plugins_dir) if plugins_dir else None, plugin_mode,
+                                                                   plugin_timeout, PLUGIN_METRICS.time_budget, PLUGIN_METRICS.budget_policy))
+
+
+def _hash_file(path: Path, chunk: int=1 << 20) -> Optional[str]:
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(chunk), b""):
+                h.update(block)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def hash_files(paths: List[Path], threads: int=8) -> List[Optional[str]]:
+    """SHA-256 of each file's bytes (None if unreadable).
+
+    Runs in threads: file reads and hashlib on large buffers release the GIL.
+    """
+    with ThreadPoolExecutor(max(1, threads), thread_name_prefix="par-hash") as ex:
+        return list(ex.map(_hash_file, paths))
+
+
+def plan_lpt(items: Iterable[Tuple[Path, Path]], jobs: int, throughput: Optional[Dict[str, float]]=None,
+             shard_bytes: Optional[int]=None, skip: frozenset=frozenset()) -> List[Dict[str, Any]]:
+    """Longest-processing-time-first task list for (src, dest) pairs.
+
+    Cost is file size divided by the expected bytes/s for the file's suffix
+    (`throughput`, e.g. from `db.throughput_by_suffix()`; plain size when
+    unknown). Files bigger than `shard_bytes` (default: an even share of the
+    total, at least MIN_SHARD_BYTES) become several shard tasks.
+    """
+    throughput = throughput or {}
+    default_tp = throughput.get("*") or 1.0
+    stats = []
+    for seq, (src, dest) in enumerate(items):
+        if seq in skip:
+            continue
+        src = Path(src)
+        try:
+            size = src.stat().st_size
+        except OSError:
+            size = 0
+        stats.append((seq, src, Path(dest), size))
+    total = sum(s[3] for s in stats)
+    shard_bytes = shard_bytes or max(MIN_SHARD_BYTES, math.ceil(total / max(1, jobs)))
+    tasks = []
+    for seq, src, dest, size in stats:
+        tp = throughput.get(src.suffix.lower()) or default_tp
+        k = max(1, math.ceil(size / shard_bytes))
+        step = math.ceil(size / k)
+        for idx in range(k):
+            start, end = idx * step, min(size, (idx + 1) * step)
+            tasks.append({"seq": seq, "src": src, "dest": dest, "shard": idx, "shards": k,
+                          "start": start, "end": end, "cost": (end - start) / tp})
+    tasks.sort(key=lambda t: (-t["cost"], t["seq"], t["shard"]))
+    return tasks
+
+
+class _LptQueue:
+    """`plan_lpt` tasks in LPT order, or the remaining shards of one input on request."""
+
+    def __init__(self, tasks: List[Dict[str, Any]]):
+        self.tasks = tasks
+        self.by_seq = sorted(range(len(tasks)), key=lambda i: (tasks[i]["seq"], tasks[i]["shard"]))
+        self.taken = [False] * len(tasks)
+        self.left = len(tasks)
+        self.pos = self.head = 0
+
+    def pop(self, seq: Optional[int]=None) -> Optional[Dict[str, Any]]:
+        # next task in LPT order; with `seq`, the next unsubmitted shard of that input or None
+        if seq is None:
+            while self.pos < len(self.tasks) and self.taken[self.pos]:
+                self.pos += 1
+            i = self.pos
+        else:
+            while self.head < len(self.by_seq) and self.taken[self.by_seq[self.head]]:
+                self.head += 1
+            i = self.by_seq[self.head] if self.head < len(self.by_seq) else len(self.tasks)
+            if i < len(self.tasks) and self.tasks[i]["seq"] != seq:
+                return None
+        if i >= len(self.tasks):
+            return None
+        self.taken[i] = True
+        self.left -= 1
+        return self.tasks[i]
+
+
+def redact_parallel(items: Iterable[Tuple[Path, Path]], jobs: int, user: str="user", strategy: str="smart",
+                    plugins_dir: Path=None, plugin_mode: str="inproc", order: str="input", commit_every: int=64,
+                    audit: AuditWriter=None, schedule: str="fifo", shard_bytes: int=None,
+                    use_history: bool=True, dedupe: bool=False, hash_threads: int=8,
+                    plugin_timeout: float=DEFAULT_TIMEOUT, prepare: bool=False) -> Iterator[Tuple[Path, Dict[str, Any]]]:
+    """Redact (src, dest) pairs with `jobs` worker processes.
+
+    Yields (src, result) once each record is committed; results carry
+    `op_id`, `chain_hash`, `findings` and `output` (no diff, no texts).
+    `schedule="lpt"` plans the whole batch up front (see `plan_lpt`).
+
+    With `dedupe`, inputs are hashed first and byte-identical files are
+    processed once: the parent writes the redacted text to every duplicate's
+    output and chains a snapshot-less entry for each duplicate right after
+    the original, with `duplicate_of` set to the original op id in meta.
+    """
+    if order not in ("input", "completion"):
+        raise ValueError(f"unknown order: {order}")
+    if schedule not in ("fifo", "lpt"):
+        raise ValueError(f"unknown schedule: {schedule}")
+    from par_core.service import build_op
+    audit = audit or AuditWriter()
+    commit_every = max(1, commit_every)
+    window = max(1, jobs) * 4
+    dup_of: Dict[int, int] = {}
+    dups: Dict[int, List[int]] = {}
+    srcs: Dict[int, Tuple[Path, Path]] = {}
+    if dedupe:
+        items = [(Path(src), Path(dest)) for src, dest in items]
+        first: Dict[str, int] = {}
+        for seq, h in enumerate(hash_files([src for src, _ in items], hash_threads)):
+            if h is None:
+                continue
+            orig = first.setdefault(h, seq)
+            if orig != seq:
+                dup_of[seq] = orig
+                dups.setdefault(orig, []).append(seq)
+                srcs[seq] = items[seq]
+    lpt = None
+    if schedule == "lpt":
+        tp = throughput_by_suffix(audit.db_path) if use_history else None
+        lpt = _LptQueue(plan_lpt(items, jobs, tp, shard_bytes, frozenset(dup_of)))
+    else:
+        tasks = ({"seq": seq, "src": Path(src), "dest": Path(dest), "shards": 1}
+                 for seq, (src, dest) in enumerate(items) if seq not in dup_of)
+    nshards: Dict[int, int] = {}
+    shards: Dict[int, Dict[int, tuple]] = {}
+    ready: Dict[int, tuple] = {}
+    pending: List[tuple] = []
+    next_seq = 0
+
+    def dup_op(seq: int, op: Dict[str, Any], op_id: int) -> Dict[str, Any]:
+        meta = dict(op["meta"], seq=seq, duplicate_of=op_id)
+        meta.pop("elapsed_ms", None)
+        return {"user": op["user"], "action": op["action"], "file_path": str(srcs[seq][0]),
+                "before_text": None, "after_text": None, "meta": meta,
+                "before_hash": op.get("before_hash") or hashlib.sha256(op["before_text"].encode("utf-8")).hexdigest(),
+                "after_hash": op.get("after_hash") or hashlib.sha256(op["after_text"].encode("utf-8")).hexdigest()}
+
+    def commit():
+        # duplicates need their original's op id, so they go in the following group
+        while pending:
+            group = [(seq, op.result() if isinstance(op, Future) else op, findings) for seq, op, findings in pending]
+            pending.clear()
+            ids = audit.record_many([op for _, op, _ in group])
+            for (seq, op, findings), (op_id, chain_hash) in zip(group, ids):
+                src, dest = srcs.pop(seq)
+                res = {"op_id": op_id, "chain_hash": chain_hash, "findings": findings, "output": dest}
+                if seq in dup_of:
+                    res["duplicate_of"] = op["meta"]["duplicate_of"]
+                yield src, res
+                for d in dups.pop(seq, []):
+                    pending.append((d, dup_op(d, op, op_id), findings))
+
+    def accept(res: Dict[str, Any]):
+        seq, text, findings, redacted, elapsed = res["seq"], res["text"], res["findings"], res["redacted"], res["elapsed"]
+        op = build_op(user, strategy, str(srcs[seq][0]), text, findings, redacted, order=order, seq=seq,
+                      bytes=len(text.encode("utf-8")), elapsed_ms=round(elapsed * 1000, 3))
+        for d in dups.get(seq, []):
+            srcs[d][1].write_text(redacted, encoding="utf-8")
+        pending.append((seq, audit.prepare(op) if prepare else op, findings))
+
+    def stitch(seq: int, parts: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        # shard spans are local; shift them by the length of the preceding shards
+        texts, redacted, findings, offset, elapsed = [], [], [], 0, 0.0
+        for idx in sorted(parts):
+            part = parts[idx]
+            findings.extend(dict(f, span=(f["span"][0] + offset, f["span"][1] + offset)) for f in part["findings"])
+            texts.append(part["text"]); redacted.append(part["redacted"])
+            offset += len(part["text"]); elapsed += part["elapsed"]
+        out = "".join(redacted)
+        srcs[seq][1].write_text(out, encoding="utf-8")
+        return {"kind": "file", "seq": seq, "text": "".join(texts), "findings": findings, "redacted": out, "elapsed": elapsed}
+
+    with make_process_pool(jobs, strategy, plugins_dir, plugin_mode, plugin_timeout) as ex:
+        running = set()
+        exhausted = False
+        def submit(t: Dict[str, Any]):
+            srcs[t["seq"]] = (t["src"], t["dest"])
+            if t["shards"] > 1:
+                nshards[t["seq"]] = t["shards"]
+                running.add(ex.submit(_redact_shard_job, t["seq"], t["shard"], str(t["src"]), t["start"], t["end"]))
+            else:
+                running.add(ex.submit(_redact_job, t["seq"], str(t["src"]), str(t["dest"])))
+        while running or not exhausted:
+            # with order="input" ready results count too, so a slow head-of-line
+            # file holds back submissions instead of letting the buffer grow
+            while not exhausted and len(running) + (len(ready) if order == "input" else 0) < window:
+                t = lpt.pop() if lpt is not None else next(tasks, None)
+                if t is None:
+                    exhausted = True
+                    break
+                submit(t)
+            if lpt is not None and order == "input" and not exhausted:
+                # LPT may not have reached the input the buffer waits for: submit it now
+                t = lpt.pop(next_seq)
+                while t is not None:
+                    submit(t)
+                    t = lpt.pop(next_seq)
+                exhausted = lpt.left == 0
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                res, metrics = fut.result()
+                PLUGIN_METRICS.merge(metrics)
+                if res["kind"] == "shard":
+                    parts = shards.setdefault(res["seq"], {})
+                    parts[res["shard"]] = res
+                    if len(parts) < nshards[res["seq"]]:
+                        continue
+                    del nshards[res["seq"]]
+                    res = stitch(res["seq"], shards.pop(res["seq"]))
+                if order == "completion":
+                    accept(res)
+                else:
+                    ready[res["seq"]] = res
+            while next_seq in ready or next_seq in dup_of:
+                if next_seq in ready:
+                    accept(ready.pop(next_seq))
+                next_seq += 1
+            if len(pending) >= commit_every:
+                yield from commit()
+        yield from commit()
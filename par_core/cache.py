@@ -0,0 +1,124 @@
+"""
+Content-addressed redaction result cache.
+
+A result is keyed by (content hash, ruleset hash, strategy, masking-policy
+hash, plugin versions) and points at the audit operation whose `after`
+snapshot holds the redacted text. Unchanged inputs are then served from the
+audit DB without detection or redaction.
+
+Developer notes:
+- Tables live in the audit DB next to `operations`/`snapshots` and are read
+  and written through its ConnectionManager (pooled readers, BEGIN IMMEDIATE
+  writes retried while the DB is locked).
+- `file_stats` remembers (size, mtime_ns, inode) -> content hash per path, so
+  an untouched file is recognised from one stat() call without being read.
+  The stat stored is the one taken before the text was read, never a later one.
+- Only finding types and spans are cached, never the matched text.
+"""
+
+import hashlib, json, os, pathlib, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from par_core import db
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_cache (
+  key TEXT PRIMARY KEY,
+  op_id INTEGER NOT NULL,
+  after_hash TEXT NOT NULL,
+  findings TEXT,
+  FOREIGN KEY(op_id) REFERENCES operations(id)
+);
+CREATE TABLE IF NOT EXISTS file_stats (
+  path TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  inode INTEGER NOT NULL,
+  content_hash TEXT NOT NULL
+);
+"""
+
+REUSE_POLICIES = ("light", "none")
+
+
+def config_key(ruleset: str, strategy: str, policy: str, plugins: str) -> str:
+    return hashlib.sha256(json.dumps([ruleset, strategy, policy, plugins]).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Cache lookups/stores against the audit DB.
+
+    `reuse_audit="light"` makes callers append a snapshot-less "reuse" entry
+    to the chain on a hit; "none" records nothing.
+    """
+
+    def __init__(self, db_path: Optional[os.PathLike] = None, reuse_audit: str = "light"):
+        if reuse_audit not in REUSE_POLICIES:
+            raise ValueError(f"unknown reuse policy: {reuse_audit}")
+        self._db_path = db_path
+        self.reuse_audit = reuse_audit
+        self._lock = threading.Lock()
+        self._schema_for = None
+        self.hits = 0
+        self.misses = 0
+
+    def _manager(self) -> db.ConnectionManager:
+        # the audit DB's shared connections; the cache tables are created once per DB
+        m = db.get_manager(self._db_path)
+        with self._lock:
+            if self._schema_for is not m:
+                with m.transaction() as con:
+                    for stmt in db._statements(CACHE_SCHEMA):
+                        con.execute(stmt)
+                self._schema_for = m
+        return m
+
+    def read(self, path: pathlib.Path) -> Tuple[str, Optional[str], Tuple[int, int, int]]:
+        """Content hash of `path`, its text when it had to be read, and the
+        (size, mtime_ns, inode) seen before reading.
+
+        The stat pre-check avoids reading and hashing files that have not
+        changed since they were last seen. Pass the returned stat to
+        `remember`: it was taken before the text was read, so a file changed
+        in between is read again next time instead of being matched to the
+        old hash.
+        """
+        st = path.stat()
+        stat = (st.st_size, st.st_mtime_ns, st.st_ino)
+        with self._manager().reader() as con:
+            row = con.execute("SELECT size, mtime_ns, inode, content_hash FROM file_stats WHERE path=?;", (str(path),)).fetchone()
+        if row and tuple(row[:3]) == stat:
+            return row[3], None, stat
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        return hashlib.sha256(text.encode("utf-8")).hexdigest(), text, stat
+
+    def remember(self, path: pathlib.Path, content_hash: str, stat: Tuple[int, int, int]):
+        with self._manager().transaction() as con:
+            con.execute("INSERT OR REPLACE INTO file_stats (path, size, mtime_ns, inode, content_hash) VALUES (?,?,?,?,?);",
+                        (str(path), *stat, content_hash))
+
+    def lookup(self, content_hash: str, config: str) -> Optional[Dict[str, Any]]:
+        key = hashlib.sha256((content_hash + config).encode("ascii")).hexdigest()
+        with self._manager().reader() as con:
+            row = con.execute("SELECT op_id, after_hash, findings FROM result_cache WHERE key=?;", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        redacted = db.read_snapshot(row[0], "after", self._db_path)
+        if redacted is None or hashlib.sha256(redacted.encode("utf-8")).hexdigest() != row[1]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        findings = [{"type": t, "span": (s, e)} for t, s, e in json.loads(row[2] or "[]")]
+        return {"op_id": row[0], "after_hash": row[1], "redacted": redacted, "findings": findings}
+
+    def store(self, content_hash: str, config: str, op_id: int, redacted: str, findings: List[Dict[str, Any]]):
+        key = hashlib.sha256((content_hash + config).encode("ascii")).hexdigest()
+        spans = json.dumps([[f["type"], f["span"][0], f["span"][1]] for f in findings], ensure_ascii=False)
+        with self._manager().transaction() as con:
+            con.execute("INSERT OR REPLACE INTO result_cache (key, op_id, after_hash, findings) VALUES (?,?,?,?);",
+                        (key, op_id, hashlib.sha256(redacted.encode("utf-8")).hexdigest(), spans))
+
+    def close(self):
+        # connections are shared per DB file (see AuditWriter.close); they reopen lazily on next use
+        db.get_manager(self._db_path).close()
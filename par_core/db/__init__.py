@@ -9,6 +9,28 @@ Notes by developer:
 - Keep the schema simple to ease manual inspection.
 - The hashing approach is intentionally straightforward (SHA-256 of payload)
   so that auditors can reproduce chain hashes offline if necessary.
+- Connections come from a per-process `ConnectionManager` per DB file: one
+  writer connection behind a lock plus a pool of read-only connections. The
+  schema is applied once and tracked in PRAGMA user_version.
+- Snapshot contents live in `blobs`, keyed by the SHA-256 of the text (the
+  same value as before_hash/after_hash) and stored once; `snapshots` rows
+  only point at a blob. `refcount` counts those rows, `gc_blobs` deletes
+  blobs nobody points at any more.
+- An `after` text that is `before` with the finding spans replaced is stored
+  as a delta blob (JSON [offset, length, replacement] edits against the
+  `before` blob, which it holds a reference to) when the compressed edits
+  are smaller than the compressed text. Deltas are rebuilt and hash checked
+  on read; anything else (e.g. plugin transformers) is a full blob.
+- With the "chunked" backend (see SNAPSHOT_BACKENDS), large texts are split
+  into content-defined chunks (par_core.db.chunking) stored once each in
+  `chunks`; the blob is then the ordered list of its chunks in `blob_chunks`
+  and `iter_snapshot` streams it back chunk by chunk.
+- Blobs and chunks name their compression codec (par_core.db.compression)
+  and preset dictionary id; SNAPSHOT_CODEC picks the codec for new writes,
+  `train_zdict` stores a dictionary trained on recent snapshots in `zdicts`.
+- `AuditWriter.prepare` encodes, hashes and compresses an operation's texts
+  in worker threads before the write transaction; texts are processed in
+  STREAM_CHARS slices, so their full UTF-8 encoding is never held at once.
 """
 
 # Small human touch: a very short usage example is embedded below.
@@ -19,11 +41,22 @@ Notes by developer:
 # -- file continues with original content --
 
 
-import sqlite3, pathlib, datetime, hashlib, zlib, json, os
-from typing import Optional, Tuple, Dict, Any
+import atexit, codecs, contextlib, queue, random, sqlite3, pathlib, datetime, hashlib, zlib, json, os, threading, time, weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple, Dict, Any, List
+
+from . import compression
+from .chunking import CHUNKED_MIN_BYTES, iter_chunks
+from .compression import CODECS, register_codec
 
 DB_PATH = pathlib.Path.home() / ".priv_audit_redactor.sqlite3"
 
+# "blob": one compressed blob per text; "chunked": texts of CHUNKED_MIN_BYTES
+# or more are stored as content-defined chunks shared across versions
+SNAPSHOT_BACKENDS = ("blob", "chunked")
+SNAPSHOT_BACKEND = "blob"
+SNAPSHOT_CODEC = compression.DEFAULT_CODEC  # any name in CODECS
+
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS operations (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -40,22 +73,264 @@ CREATE TABLE IF NOT EXISTS operations (
 CREATE TABLE IF NOT EXISTS snapshots (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   op_id INTEGER NOT NULL,
-  kind TEXT NOT NULL, -- "before" | "after"
+  kind TEXT NOT NULL, -- "before" | "after" | "findings"
   content BLOB NOT NULL,
   FOREIGN KEY(op_id) REFERENCES operations(id)
 );
 """
 
-def _connect():
-    con = sqlite3.connect(str(DB_PATH))
-    con.execute("PRAGMA journal_mode=WAL;")
-    return con
+# v2: lookups by op, file, user, time and content hash (query_operations)
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_snapshots_op ON snapshots(op_id, kind);
+CREATE INDEX IF NOT EXISTS idx_operations_file_path ON operations(file_path, id);
+CREATE INDEX IF NOT EXISTS idx_operations_user ON operations(user, id);
+CREATE INDEX IF NOT EXISTS idx_operations_op_time ON operations(op_time);
+CREATE INDEX IF NOT EXISTS idx_operations_before_hash ON operations(before_hash);
+"""
+
+# v3: content-addressed snapshot store; `snapshots` is rebuilt to point at blobs
+BLOBS = """
+CREATE TABLE IF NOT EXISTS blobs (
+  hash TEXT PRIMARY KEY, -- sha256 of the UTF-8 text
+  encoding TEXT NOT NULL DEFAULT 'full',
+  content BLOB NOT NULL,
+  size INTEGER NOT NULL, -- bytes of the UTF-8 text
+  refcount INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE snapshot_refs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  op_id INTEGER NOT NULL,
+  kind TEXT NOT NULL, -- "before" | "after" | "findings"
+  blob_hash TEXT NOT NULL,
+  FOREIGN KEY(op_id) REFERENCES operations(id),
+  FOREIGN KEY(blob_hash) REFERENCES blobs(hash)
+);
+"""
+
+def _statements(script: str) -> Iterator[str]:
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf
+            buf = ""
+    if buf.strip():
+        yield buf
+
+def _blob_store(con: sqlite3.Connection):
+    # move every inline snapshot into `blobs`; the zlib content is reused as is
+    for stmt in _statements(BLOBS):
+        con.execute(stmt)
+    cur = con.execute("SELECT id, op_id, kind, content FROM snapshots ORDER BY id;")
+    while True:
+        rows = cur.fetchmany(512)
+        if not rows:
+            break
+        for sid, op_id, kind, content in rows:
+            data = zlib.decompress(content)
+            h = _hash_bytes(data)
+            if con.execute("UPDATE blobs SET refcount=refcount+1 WHERE hash=?;", (h,)).rowcount == 0:
+                con.execute("INSERT INTO blobs (hash, encoding, content, size, refcount) VALUES (?,?,?,?,1);",
+                            (h, "full", content, len(data)))
+            con.execute("INSERT INTO snapshot_refs (id, op_id, kind, blob_hash) VALUES (?,?,?,?);", (sid, op_id, kind, h))
+    con.execute("DROP TABLE snapshots;")
+    con.execute("ALTER TABLE snapshot_refs RENAME TO snapshots;")
+    con.execute("CREATE INDEX idx_snapshots_op ON snapshots(op_id, kind);")
+    con.execute("CREATE INDEX idx_snapshots_blob ON snapshots(blob_hash);")
+
+# v4: delta blobs name the blob they apply to
+DELTAS = """
+ALTER TABLE blobs ADD COLUMN base TEXT;
+CREATE INDEX IF NOT EXISTS idx_blobs_base ON blobs(base);
+"""
+
+# v5: chunk store for the "chunked" snapshot backend
+CHUNKS = """
+CREATE TABLE IF NOT EXISTS chunks (
+  hash TEXT PRIMARY KEY, -- sha256 of the chunk bytes
+  content BLOB NOT NULL,
+  size INTEGER NOT NULL,
+  refcount INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS blob_chunks (
+  blob_hash TEXT NOT NULL,
+  seq INTEGER NOT NULL,
+  chunk_hash TEXT NOT NULL,
+  PRIMARY KEY (blob_hash, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_blob_chunks_chunk ON blob_chunks(chunk_hash);
+"""
+
+# v6: per-blob codec and preset dictionary; rows from before v6 are plain zlib
+CODEC_COLUMNS = """
+ALTER TABLE blobs ADD COLUMN codec TEXT NOT NULL DEFAULT 'zlib';
+ALTER TABLE blobs ADD COLUMN dict_id INTEGER;
+ALTER TABLE chunks ADD COLUMN codec TEXT NOT NULL DEFAULT 'zlib';
+ALTER TABLE chunks ADD COLUMN dict_id INTEGER;
+CREATE TABLE IF NOT EXISTS zdicts (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  created TEXT NOT NULL,
+  samples INTEGER NOT NULL,
+  content BLOB NOT NULL
+);
+"""
+
+# MIGRATIONS[i] upgrades a DB from user_version i to i + 1: an SQL script or a
+# callable taking the connection; each runs inside the migration transaction.
+MIGRATIONS: List[Any] = [SCHEMA, INDEXES, _blob_store, DELTAS, CHUNKS, CODEC_COLUMNS]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _migrate(con: sqlite3.Connection):
+    # `con` must be in autocommit mode (isolation_level=None)
+    def version() -> int:
+        v = con.execute("PRAGMA user_version;").fetchone()[0]
+        if v > SCHEMA_VERSION:
+            raise RuntimeError(f"audit DB schema v{v} is newer than this build supports (v{SCHEMA_VERSION})")
+        return v
+    if version() == SCHEMA_VERSION:
+        return
+    con.execute("BEGIN IMMEDIATE;")
+    try:
+        for v in range(version(), SCHEMA_VERSION):  # re-read under the write lock
+            step = MIGRATIONS[v]
+            if callable(step):
+                step(con)
+            else:
+                for stmt in _statements(step):
+                    con.execute(stmt)
+        con.execute(f"PRAGMA user_version={SCHEMA_VERSION};")
+    except BaseException:
+        con.execute("ROLLBACK;")
+        raise
+    con.execute("COMMIT;")
+
+BUSY_TIMEOUT = 1.0   # seconds SQLite's own busy handler waits per attempt
+LOCK_TIMEOUT = 60.0  # overall budget for retrying a locked DB
+
+def _retry_locked(fn, timeout: float = None):
+    # retry `fn` while SQLite reports the DB as locked/busy, with jittered exponential backoff
+    deadline = time.monotonic() + (LOCK_TIMEOUT if timeout is None else timeout)
+    delay = 0.005
+    while True:
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            msg = str(e).lower()
+            if ("locked" not in msg and "busy" not in msg) or time.monotonic() + delay > deadline:
+                raise
+        time.sleep(delay * random.uniform(0.5, 1.5))
+        delay = min(delay * 2, 0.25)
+
+class ConnectionManager:
+    """Connections of this process to one audit DB.
+
+    `transaction()` hands out the single writer connection under `lock`;
+    `reader()` lends a read-only connection from a small pool. The writer is
+    opened (and the schema migrated) on first use.
+    """
+
+    def __init__(self, path: os.PathLike, readers: int = 4):
+        self.path = pathlib.Path(path)
+        self.readers = readers
+        self.lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._pool: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # a forked child must not touch the parent's handles
+        if self._pid != os.getpid():
+            self._writer, self._pool, self._pid = None, [], os.getpid()
+            self.lock, self._pool_lock = threading.RLock(), threading.Lock()
+
+    def writer(self) -> sqlite3.Connection:
+        self._check_pid()
+        with self.lock:
+            if self._writer is None:
+                # autocommit mode: transaction() issues BEGIN IMMEDIATE itself
+                con = sqlite3.connect(str(self.path), check_same_thread=False, timeout=BUSY_TIMEOUT, isolation_level=None)
+                _retry_locked(lambda: con.execute("PRAGMA journal_mode=WAL;"))
+                _retry_locked(lambda: _migrate(con))
+                self._writer = con
+            return self._writer
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction on the writer connection.
+
+        BEGIN IMMEDIATE takes the DB write lock before anything is read, so
+        the last chain hash cannot change under us even with other processes
+        appending; a busy DB is retried with backoff up to LOCK_TIMEOUT. A
+        COMMIT that fails (still busy, disk full, deferred constraint) is
+        rolled back, so the writer is never left inside a transaction.
+        """
+        with self.lock:
+            con = self.writer()
+            _retry_locked(lambda: con.execute("BEGIN IMMEDIATE;"))
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK;")
+                raise
+            try:
+                _retry_locked(lambda: con.execute("COMMIT;"))
+            except BaseException:
+                if con.in_transaction:
+                    con.execute("ROLLBACK;")
+                raise
+
+    @contextlib.contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        self._check_pid()
+        with self._pool_lock:
+            con = self._pool.pop() if self._pool else None
+        if con is None:
+            if self._writer is None:
+                self.writer()  # creates the file and schema if needed; skips the lock a transaction holds
+            con = sqlite3.connect(self.path.resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+        try:
+            yield con
+        finally:
+            with self._pool_lock:
+                if len(self._pool) < self.readers:
+                    self._pool.append(con)
+                    con = None
+            if con is not None:
+                con.close()
+
+    def close(self):
+        with self.lock, self._pool_lock:
+            for con in self._pool + ([self._writer] if self._writer is not None else []):
+                con.close()
+            self._writer, self._pool = None, []
+
+_MANAGERS: Dict[str, ConnectionManager] = {}
+_MANAGERS_LOCK = threading.Lock()
+
+def get_manager(db_path: Optional[os.PathLike] = None) -> ConnectionManager:
+    """Process-wide ConnectionManager for `db_path` (default: DB_PATH)."""
+    path = pathlib.Path(db_path or DB_PATH)
+    key = str(path.resolve())
+    with _MANAGERS_LOCK:
+        m = _MANAGERS.get(key)
+        if m is None:
+            m = _MANAGERS[key] = ConnectionManager(path)
+        return m
+
+_GROUPED_WRITERS: "weakref.WeakSet" = weakref.WeakSet()
+
+@atexit.register
+def close_connections():
+    for w in list(_GROUPED_WRITERS):
+        w.flush()
+    with _MANAGERS_LOCK:
+        for m in _MANAGERS.values():
+            m.close()
+        _MANAGERS.clear()
 
 def init_db():
-    con = _connect()
-    with con:
-        con.executescript(SCHEMA)
-    con.close()
+    get_manager().writer()
 
 def _hash_bytes(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
@@ -64,58 +339,701 @@ def _calc_chain(prev_chain_hash: Optional[str], payload: Dict[str, Any]) -> str:
     base = (prev_chain_hash or "").encode("utf-8") + json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
     return _hash_bytes(base)
 
-def _compress(text: str) -> bytes:
-    return zlib.compress(text.encode("utf-8"))
+STREAM_CHARS = 1 << 20  # texts are encoded, hashed and compressed this many characters at a time
+
+def _packing(con, codec: str) -> Tuple[str, Optional[int], Optional[bytes]]:
+    # (codec, dict_id, zdict) for new blobs; dictionary codecs use the newest trained dictionary
+    if compression.uses_dict(codec):
+        row = con.execute("SELECT id, content FROM zdicts ORDER BY id DESC LIMIT 1;").fetchone()
+        if row is None:
+            return compression.DEFAULT_CODEC, None, None  # nothing trained yet
+        return codec, row[0], row[1]
+    return codec, None, None
+
+def _pack(data: bytes, packing) -> Tuple[str, Optional[int], bytes]:
+    codec, dict_id, zdict = packing
+    return codec, dict_id, compression.compress(codec, data, zdict)
+
+def _unpack(con, content: bytes, codec: str, dict_id: Optional[int]) -> bytes:
+    zdict = None
+    if dict_id is not None:
+        row = con.execute("SELECT content FROM zdicts WHERE id=?;", (dict_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"compression dictionary {dict_id} is missing")
+        zdict = row[0]
+    return compression.decompress(codec, content, zdict)
+
+def _stream_text(text: str, packing=None) -> Tuple[str, int, Optional[tuple]]:
+    # (hash, size, packed) of the UTF-8 text, one slice at a time: the whole
+    # encoded text is never held; hashlib and zlib release the GIL on each slice
+    digest, size = hashlib.sha256(), 0
+    comp = compression.compressor(packing[0], packing[2]) if packing else None
+    parts = []
+    for i in range(0, len(text), STREAM_CHARS):
+        piece = text[i:i + STREAM_CHARS].encode("utf-8")
+        digest.update(piece)
+        size += len(piece)
+        if comp is not None:
+            parts.append(comp.compress(piece))
+    if comp is None:
+        return digest.hexdigest(), size, None
+    parts.append(comp.flush())
+    return digest.hexdigest(), size, (packing[0], packing[1], b"".join(parts))
+
+def _existing(con, table: str, hashes: List[str]) -> set:
+    found = set()
+    for i in range(0, len(hashes), 500):
+        part = hashes[i:i + 500]
+        found.update(r[0] for r in con.execute(f"SELECT hash FROM {table} WHERE hash IN ({','.join('?' * len(part))});", part))
+    return found
+
+def _apply_edits(base: str, edits) -> Optional[str]:
+    parts, pos = [], 0
+    for off, length, rep in edits:
+        if off < pos:
+            return None
+        parts.append(base[pos:off]); parts.append(rep)
+        pos = off + length
+    parts.append(base[pos:])
+    return "".join(parts)
+
+def _prepare_blob(con, text: str, packing, chunked: bool = False, base_text: Optional[str] = None, edits=None,
+                  base_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Hash `text` and build what storing it takes, unless `con` already has it.
+
+    Returns {"hash", "size", "encoding"} plus, by encoding: "packed" (full
+    blob or delta edits against `base_text`) or "chunks" ([hash, size,
+    packed or None when the chunk is stored already]). "encoding" is None
+    for a blob that is stored already. With `base_hash`, a delta is only
+    built when that base is not a delta itself.
+    """
+    # Texts up to STREAM_CHARS are encoded once; the bytes serve the hash,
+    # the existence check and the compression (chunking needs them anyway).
+    # Longer texts are hashed slice by slice first and, only when the blob is
+    # new, encoded again slice by slice while compressing: that keeps their
+    # full encoding out of memory, and compressing during the hash pass would
+    # be wasted on texts that are stored already (unchanged `before`s).
+    data = text.encode("utf-8") if chunked or len(text) <= STREAM_CHARS else None
+    if data is not None:
+        h, size = _hash_bytes(data), len(data)
+    else:
+        h, size, _ = _stream_text(text)
+    if _existing(con, "blobs", [h]):
+        return {"hash": h, "size": size, "encoding": None}
+    delta = None
+    if edits is not None and base_text is not None and _apply_edits(base_text, edits) == text:
+        row = con.execute("SELECT encoding FROM blobs WHERE hash=?;", (base_hash,)).fetchone() if base_hash else None
+        if row is None or row[0] != "delta":  # deltas are one level deep
+            delta = _pack(json.dumps(edits, ensure_ascii=False).encode("utf-8"), packing)
+    if chunked and size >= CHUNKED_MIN_BYTES:
+        pieces = [(_hash_bytes(piece), piece) for piece in iter_chunks(data)]
+        stored = _existing(con, "chunks", [ch for ch, _ in pieces])
+        entry = {"hash": h, "size": size, "encoding": "chunked",
+                 "chunks": [(ch, len(piece), None if ch in stored else _pack(piece, packing)) for ch, piece in pieces]}
+        cost = sum(len(packed[2]) for _, _, packed in entry["chunks"] if packed is not None)
+    else:
+        packed = _pack(data, packing) if data is not None else _stream_text(text, packing)[2]
+        entry, cost = {"hash": h, "size": size, "encoding": "full", "packed": packed}, len(packed[2])
+    # dense findings make the edit list outgrow the compressed text: keep whichever is smaller
+    if delta is not None and len(delta[2]) < cost:
+        return {"hash": h, "size": size, "encoding": "delta", "packed": delta}
+    return entry
+
+def _storable(con, entry: Dict[str, Any], base_hash: Optional[str]) -> bool:
+    # whether a blob prepared outside the transaction can still be stored as prepared
+    enc = entry["encoding"]
+    if enc == "delta":
+        row = con.execute("SELECT encoding FROM blobs WHERE hash=?;", (base_hash,)).fetchone()
+        return row is not None and row[0] != "delta"
+    if enc == "chunked":
+        known = [ch for ch, _, packed in entry["chunks"] if packed is None]
+        return len(_existing(con, "chunks", known)) == len(set(known))
+    return enc == "full"
+
+def _ref_blob(con, h: str) -> bool:
+    # one more reference to blob `h`; False when it is not stored yet
+    return con.execute("UPDATE blobs SET refcount=refcount+1 WHERE hash=?;", (h,)).rowcount > 0
+
+def _insert_blob(con, entry: Dict[str, Any], base_hash: Optional[str] = None):
+    h, size, enc = entry["hash"], entry["size"], entry["encoding"]
+    sql = "INSERT INTO blobs (hash, encoding, size, refcount, base, codec, dict_id, content) VALUES (?,?,?,1,?,?,?,?);"
+    if enc == "delta":
+        _ref_blob(con, base_hash)
+        con.execute(sql, (h, "delta", size, base_hash, *entry["packed"]))
+    elif enc == "chunked":
+        for ch, n, packed in entry["chunks"]:
+            if con.execute("UPDATE chunks SET refcount=refcount+1 WHERE hash=?;", (ch,)).rowcount == 0:
+                con.execute("INSERT INTO chunks (hash, size, refcount, codec, dict_id, content) VALUES (?,?,1,?,?,?);", (ch, n, *packed))
+        con.executemany("INSERT INTO blob_chunks (blob_hash, seq, chunk_hash) VALUES (?,?,?);",
+                        [(h, seq, ch) for seq, (ch, _, _) in enumerate(entry["chunks"])])
+        con.execute(sql, (h, "chunked", size, None, compression.DEFAULT_CODEC, None, b""))
+    else:
+        con.execute(sql, (h, "full", size, None, *entry["packed"]))
+
+def _decode_chunks(h: str, pieces: Iterator[bytes]) -> Iterator[str]:
+    # decoded text of chunked blob `h`, one chunk at a time (a chunk may end inside a UTF-8 sequence)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    digest = hashlib.sha256()
+    for piece in pieces:
+        digest.update(piece)
+        text = decoder.decode(piece)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if digest.hexdigest() != h:
+        raise ValueError(f"chunked blob {h} failed its hash check")
+    if tail:
+        yield tail
 
-def _decompress(blob: bytes) -> str:
-    return zlib.decompress(blob).decode("utf-8")
+def _iter_chunked(con, h: str) -> Iterator[str]:
+    cur = con.execute("SELECT c.content, c.codec, c.dict_id FROM blob_chunks bc JOIN chunks c ON c.hash=bc.chunk_hash "
+                      "WHERE bc.blob_hash=? ORDER BY bc.seq;", (h,))
+    return _decode_chunks(h, (_unpack(con, *row) for row in cur))
+
+_BLOB_COLUMNS = "b.hash, b.encoding, b.content, b.base, b.codec, b.dict_id"
+
+def _load_blob(con, h: str, encoding: str, content: bytes, base: Optional[str], codec: str, dict_id: Optional[int]) -> str:
+    if encoding == "full":
+        return _unpack(con, content, codec, dict_id).decode("utf-8")
+    if encoding == "chunked":
+        return "".join(_iter_chunked(con, h))
+    if encoding != "delta":
+        raise ValueError(f"unknown blob encoding: {encoding}")
+    row = con.execute(f"SELECT {_BLOB_COLUMNS} FROM blobs b WHERE b.hash=?;", (base,)).fetchone()
+    if row is None:
+        raise ValueError(f"delta blob {h} lost its base {base}")
+    text = _apply_edits(_load_blob(con, *row), json.loads(_unpack(con, content, codec, dict_id)))
+    if text is None or _hash_bytes(text.encode("utf-8")) != h:
+        raise ValueError(f"delta blob {h} failed its hash check")
+    return text
+
+def _snapshot_blob(con, op_id: int, kind: str) -> Optional[tuple]:
+    return con.execute(f"SELECT {_BLOB_COLUMNS} FROM snapshots s JOIN blobs b ON b.hash=s.blob_hash "
+                       "WHERE s.op_id=? AND s.kind=?;", (op_id, kind)).fetchone()
+
+def _read_snapshots(con, op_id: int, kinds: Optional[Tuple[str, ...]] = None) -> Dict[str, str]:
+    sql = f"SELECT s.kind, {_BLOB_COLUMNS} FROM snapshots s JOIN blobs b ON b.hash=s.blob_hash WHERE s.op_id=?"
+    if kinds is not None:
+        sql += f" AND s.kind IN ({','.join('?' * len(kinds))})"
+    return {k: _load_blob(con, *blob) for k, *blob in con.execute(sql + ";", (op_id, *(kinds or ()))).fetchall()}
 
 def _get_last_chain_hash(con) -> Optional[str]:
     cur = con.execute("SELECT chain_hash FROM operations ORDER BY id DESC LIMIT 1;")
     row = cur.fetchone()
     return row[0] if row else None
 
+def _op_texts(before_text: Optional[str], after_text: Optional[str], snapshots: Optional[Dict[str, str]]) -> List[Tuple[str, str]]:
+    texts = [("before", before_text), ("after", after_text), *(snapshots or {}).items()]
+    return [(kind, text) for kind, text in texts if text is not None]
+
+def _append_operation(con, user: str, action: str, file_path: str, before_text: Optional[str], after_text: Optional[str], meta: Dict[str, Any],
+                      before_hash: Optional[str] = None, after_hash: Optional[str] = None,
+                      snapshots: Optional[Dict[str, str]] = None, after_edits=None, chunked: bool = False,
+                      codec: str = compression.DEFAULT_CODEC, prepared: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[int, str]:
+    # Texts may be None for lightweight entries (e.g. cache reuse): the caller
+    # then supplies the hashes and no snapshots are stored. `snapshots` holds
+    # extra kinds (e.g. "findings") stored next to before/after, outside the chain.
+    # `after_edits` ([offset, length, replacement] on before_text) lets `after` be a delta blob;
+    # `chunked` selects the chunked backend for large before/after texts, `codec` compresses new blobs.
+    # `prepared` holds blobs already hashed and compressed by AuditWriter.prepare.
+    prev_chain_hash = _get_last_chain_hash(con)
+    texts = _op_texts(before_text, after_text, snapshots)
+    entries = dict(prepared or {})
+    packing = None
+
+    def prepare(kind: str, text: str) -> Dict[str, Any]:
+        nonlocal packing
+        packing = packing or _packing(con, codec)
+        after = kind == "after"
+        return _prepare_blob(con, text, packing, chunked and kind in ("before", "after"), before_text if after else None,
+                             after_edits if after else None, entries["before"]["hash"] if after and "before" in entries else None)
+    for kind, text in texts:
+        if kind not in entries:
+            entries[kind] = prepare(kind, text)
+    if before_text is not None:
+        before_hash = entries["before"]["hash"]
+    if after_text is not None:
+        after_hash = entries["after"]["hash"]
+    op_time = datetime.datetime.utcnow().isoformat()
+    payload = {
+        "op_time": op_time, "user": user, "action": action,
+        "file_path": file_path, "before_hash": before_hash, "after_hash": after_hash, "meta": meta
+    }
+    chain_hash = _calc_chain(prev_chain_hash, payload)
+    cur = con.execute(
+        "INSERT INTO operations (op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta) VALUES (?,?,?,?,?,?,?,?,?);",
+        (op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, json.dumps(meta, ensure_ascii=False))
+    )
+    op_id = cur.lastrowid
+    for kind, text in texts:
+        entry = entries[kind]
+        if not _ref_blob(con, entry["hash"]):
+            base_hash = before_hash if kind == "after" else None
+            if not _storable(con, entry, base_hash):
+                entry = prepare(kind, text)  # prepared against an older state of the DB
+            _insert_blob(con, entry, base_hash)
+        con.execute("INSERT INTO snapshots (op_id, kind, blob_hash) VALUES (?,?,?);", (op_id, kind, entry["hash"]))
+    return op_id, chain_hash
+
 def record_operation(user: str, action: str, file_path: str, before_text: str, after_text: str, meta: Dict[str, Any]):
-    init_db()
-    con = _connect()
-    with con:
-        prev_chain_hash = _get_last_chain_hash(con)
-        before_hash = _hash_bytes(before_text.encode("utf-8"))
-        after_hash = _hash_bytes(after_text.encode("utf-8"))
-        op_time = datetime.datetime.utcnow().isoformat()
-        payload = {
-            "op_time": op_time, "user": user, "action": action,
-            "file_path": file_path, "before_hash": before_hash, "after_hash": after_hash, "meta": meta
-        }
-        chain_hash = _calc_chain(prev_chain_hash, payload)
-        cur = con.execute(
-            "INSERT INTO operations (op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta) VALUES (?,?,?,?,?,?,?,?,?);",
-            (op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, json.dumps(meta, ensure_ascii=False))
-        )
-        op_id = cur.lastrowid
-        con.execute("INSERT INTO snapshots (op_id, kind, content) VALUES (?,?,?);", (op_id, "before", _compress(before_text)))
-        con.execute("INSERT INTO snapshots (op_id, kind, content) VALUES (?,?,?);", (op_id, "after", _compress(after_text)))
-        return op_id, chain_hash
+    with get_manager().transaction() as con:
+        return _append_operation(con, user, action, file_path, before_text, after_text, meta)
+
+DURABILITY_PROFILES = ("strict", "grouped")
+
+class AuditWriter:
+    """Long-lived audit appender.
+
+    Appends through the process-wide writer connection of its DB (see
+    `get_manager`), so writers can be shared across threads and several
+    writers on one file never contend for separate connections. Without an
+    explicit `db_path` it follows the module-level DB_PATH.
+
+    Durability profiles:
+    - "strict": every `record` / `record_many` call is its own transaction,
+      committed before the call returns.
+    - "grouped": calls go to a write-behind queue; a background thread chains
+      and commits whatever is queued in one transaction once `group_size`
+      operations are waiting or `group_ms` has passed. `submit` returns a
+      future for (op_id, chain_hash); `record` waits for it; `flush` commits
+      everything queued so far. A failed group fails all of its futures.
+    Reads (`latest`, read_operation, ...) only see committed operations.
+
+    `backend` picks the snapshot storage for new blobs (SNAPSHOT_BACKENDS)
+    and `codec` their compression (CODECS); without them the writer follows
+    the module-level SNAPSHOT_BACKEND / SNAPSHOT_CODEC. Reads handle every
+    backend and codec.
+
+    `prepare` moves the hashing and compression of an operation off the
+    calling thread (`prep_threads` workers); the prepared operation is then
+    passed to record / record_many / submit as usual.
+    """
+
+    def __init__(self, db_path: Optional[os.PathLike] = None, durability: str = "strict",
+                 group_size: int = 256, group_ms: float = 20.0, backend: Optional[str] = None, codec: Optional[str] = None,
+                 prep_threads: int = 4):
+        if durability not in DURABILITY_PROFILES:
+            raise ValueError(f"unknown durability profile: {durability}")
+        if backend is not None and backend not in SNAPSHOT_BACKENDS:
+            raise ValueError(f"unknown snapshot backend: {backend}")
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f"unknown codec: {codec}")
+        self._db_path = db_path
+        self._backend = backend
+        self._codec = codec
+        self.prep_threads = max(1, prep_threads)
+        self._prep_pool: Optional[ThreadPoolExecutor] = None
+        self.durability = durability
+        self.group_size = max(1, group_size)
+        self.group_ms = group_ms
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        if durability == "grouped":
+            _GROUPED_WRITERS.add(self)  # flushed at exit
+
+    @property
+    def db_path(self) -> pathlib.Path:
+        return pathlib.Path(self._db_path or DB_PATH)
+
+    @property
+    def manager(self) -> ConnectionManager:
+        return get_manager(self.db_path)
+
+    @property
+    def backend(self) -> str:
+        return self._backend or SNAPSHOT_BACKEND
+
+    @property
+    def codec(self) -> str:
+        return self._codec or SNAPSHOT_CODEC
+
+    def _append(self, con, op: Dict[str, Any]) -> Tuple[int, str]:
+        return _append_operation(con, chunked=self.backend == "chunked", codec=self.codec, **op)
+
+    def _prepare_text(self, kind: str, text: str, op: Dict[str, Any]) -> Dict[str, Any]:
+        after = kind == "after"
+        with self.manager.reader() as con:
+            return _prepare_blob(con, text, _packing(con, self.codec), self.backend == "chunked" and kind in ("before", "after"),
+                                 op.get("before_text") if after else None, op.get("after_edits") if after else None)
+
+    def prepare(self, op: Dict[str, Any]) -> Future:
+        """Future for `op` (keyword arguments of `record`) with its snapshots prepared.
+
+        Each text is encoded, hashed and compressed by its own worker thread;
+        hashlib and zlib release the GIL on large buffers, so the texts are
+        processed concurrently with each other and with the caller (e.g. while
+        it detects the next file). Blobs the DB already has are only hashed.
+        The result also carries before_hash / after_hash.
+        """
+        texts = _op_texts(op.get("before_text"), op.get("after_text"), op.get("snapshots"))
+        out: Future = Future()
+        if not texts:
+            out.set_result(op)
+            return out
+        with self._thread_lock:
+            if self._prep_pool is None:
+                self._prep_pool = ThreadPoolExecutor(self.prep_threads, thread_name_prefix="par-audit-prep")
+            futures = {kind: self._prep_pool.submit(self._prepare_text, kind, text, op) for kind, text in texts}
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                prepared = {kind: f.result() for kind, f in futures.items()}
+            except Exception as e:
+                out.set_exception(e)
+                return
+            hashes = {f"{kind}_hash": prepared[kind]["hash"] for kind in ("before", "after") if kind in prepared}
+            out.set_result(dict(op, prepared=prepared, **hashes))
+        for f in futures.values():
+            f.add_done_callback(done)
+        return out
+
+    def _enqueue(self, ops: List[Dict[str, Any]], urgent: bool = False) -> List[Future]:
+        futures = [Future() for _ in ops] or [Future()]
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="par-audit-writer", daemon=True)
+                self._thread.start()
+            self._queue.put((ops, futures, urgent))
+        return futures
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            items, n = [item], len(item[0])
+            deadline = time.monotonic() + self.group_ms / 1000.0
+            stop = False
+            while n < self.group_size and not items[-1][2]:
+                try:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                items.append(nxt)
+                n += len(nxt[0])
+            self._commit(items)
+            if stop:
+                return
+
+    def _commit(self, items):
+        ops = [op for batch, _, _ in items for op in batch]
+        futures = [f for batch, fs, _ in items for f in (fs if batch else [])]
+        try:
+            with self.manager.transaction() as con:
+                results = [self._append(con, op) for op in ops]
+        except Exception as e:
+            for f in futures:
+                f.set_exception(e)
+            results = None
+        else:
+            for f, r in zip(futures, results):
+                f.set_result(r)
+        for batch, fs, _ in items:
+            if not batch:
+                fs[0].set_result(None)  # flush marker
+
+    def submit(self, **op) -> Future:
+        """Future for the (op_id, chain_hash) of one operation (keyword arguments of `record`)."""
+        if self.durability == "strict":
+            f: Future = Future()
+            try:
+                f.set_result(self.record(**op))
+            except Exception as e:
+                f.set_exception(e)
+            return f
+        return self._enqueue([op])[0]
+
+    def record(self, user: str, action: str, file_path: str, before_text: str, after_text: str, meta: Dict[str, Any],
+               **extra) -> Tuple[int, str]:
+        op = dict(user=user, action=action, file_path=file_path, before_text=before_text, after_text=after_text, meta=meta, **extra)
+        if self.durability == "grouped":
+            return self._enqueue([op])[0].result()
+        with self.manager.transaction() as con:
+            return self._append(con, op)
+
+    def latest(self, file_path: str, action: str = "redact",
+               kinds: Tuple[str, ...] = ("before", "after")) -> Optional[Dict[str, Any]]:
+        """Newest `action` operation for `file_path` with its meta and the snapshots of `kinds`."""
+        with self.manager.reader() as con:
+            row = con.execute("SELECT id, meta FROM operations WHERE file_path=? AND action=? ORDER BY id DESC LIMIT 1;",
+                              (file_path, action)).fetchone()
+            if row is None:
+                return None
+            snaps = _read_snapshots(con, row[0], tuple(kinds))
+        return {"op_id": row[0], "meta": json.loads(row[1] or "{}"), "snapshots": snaps}
+
+    def record_many(self, ops: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        """Append several operations in one transaction, chained in list order.
+
+        Each item holds the keyword arguments of `record`. Either all of them
+        are committed or none is, so the hash chain never has gaps.
+        """
+        if not ops:
+            return []
+        if self.durability == "grouped":
+            # queued as one item, so the whole list lands in a single group
+            return [f.result() for f in self._enqueue(list(ops), urgent=True)]
+        with self.manager.transaction() as con:
+            return [self._append(con, op) for op in ops]
+
+    def flush(self, timeout: Optional[float] = None):
+        """Commit everything queued so far and wait for it (no-op when strict)."""
+        if self._thread is not None:
+            self._enqueue([], urgent=True)[0].result(timeout)
+
+    def close(self):
+        # connections are shared per DB file; they reopen lazily on next use
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+            if thread is not None and thread.is_alive():
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+        with self._thread_lock:
+            pool, self._prep_pool = self._prep_pool, None
+        if pool is not None:
+            pool.shutdown()
+        self.manager.close()
+
+def throughput_by_suffix(db_path: Optional[os.PathLike] = None, limit: int = 5000) -> Dict[str, float]:
+    """Historical redaction speed in bytes/s per file suffix ("*" = all files).
+
+    Uses the `bytes` / `elapsed_ms` meta written by the parallel batch runner
+    over the last `limit` operations; empty when there is no history yet.
+    """
+    path = pathlib.Path(db_path or DB_PATH)
+    if not path.exists():
+        return {}
+    try:
+        with get_manager(path).reader() as con:
+            rows = con.execute("SELECT file_path, meta FROM operations WHERE meta LIKE '%elapsed_ms%' ORDER BY id DESC LIMIT ?;", (limit,)).fetchall()
+    except sqlite3.Error:
+        return {}
+    totals: Dict[str, list] = {}
+    for file_path, meta in rows:
+        m = json.loads(meta or "{}")
+        if not m.get("elapsed_ms") or not m.get("bytes"):
+            continue
+        for key in (pathlib.Path(file_path or "").suffix.lower(), "*"):
+            t = totals.setdefault(key, [0, 0.0])
+            t[0] += m["bytes"]; t[1] += m["elapsed_ms"] / 1000.0
+    return {k: b / s for k, (b, s) in totals.items() if s > 0}
+
+def read_snapshot(op_id: int, kind: str, db_path: Optional[os.PathLike] = None) -> Optional[str]:
+    with get_manager(db_path).reader() as con:
+        return _read_snapshots(con, op_id, (kind,)).get(kind)
+
+def iter_snapshot(op_id: int, kind: str, db_path: Optional[os.PathLike] = None) -> Iterator[str]:
+    """Text of one snapshot in pieces; chunked blobs are streamed chunk by chunk.
+
+    Yields nothing when the snapshot does not exist. The chunk list is read
+    up front and every chunk is fetched with its own short-lived pooled
+    reader, so a slow or abandoned consumer holds no connection. A chunk
+    collected meanwhile (the snapshot was pruned and `gc_blobs` ran) raises
+    ValueError, as does a chunked blob that fails its hash check (after its
+    last piece).
+    """
+    manager = get_manager(db_path)
+    with manager.reader() as con:
+        blob = _snapshot_blob(con, op_id, kind)
+        if blob is None:
+            return
+        if blob[1] != "chunked":
+            text = _load_blob(con, *blob)
+        else:
+            hashes = [r[0] for r in con.execute("SELECT chunk_hash FROM blob_chunks WHERE blob_hash=? ORDER BY seq;", (blob[0],))]
+    if blob[1] != "chunked":
+        yield text
+        return
+    def pieces():
+        for ch in hashes:
+            with manager.reader() as con:
+                row = con.execute("SELECT content, codec, dict_id FROM chunks WHERE hash=?;", (ch,)).fetchone()
+                if row is None:
+                    raise ValueError(f"chunk {ch} of blob {blob[0]} is missing")
+                piece = _unpack(con, *row)
+            yield piece
+    yield from _decode_chunks(blob[0], pieces())
+
+def train_zdict(db_path: Optional[os.PathLike] = None, samples: int = 200, size: int = compression.ZDICT_SIZE) -> Optional[int]:
+    """Train a preset dictionary on the `after` snapshots of the newest `samples` operations.
+
+    Only redacted text is sampled, and whatever `find_pii` still detects in
+    it is cut out before training, so the dictionary (which outlives
+    snapshot retention until `gc_blobs`) holds no detected PII. It is
+    stored in `zdicts` and used by "zlib-dict" writes from then on; older
+    blobs keep pointing at the dictionary they were written with. Returns
+    its id, or None when the samples share nothing.
+    """
+    from par_core.detectors.patterns import find_pii
+    with get_manager(db_path).reader() as con:
+        rows = con.execute(f"SELECT {_BLOB_COLUMNS} FROM blobs b WHERE b.hash IN "
+                           "(SELECT blob_hash FROM snapshots WHERE kind='after' ORDER BY id DESC LIMIT ?);", (samples,)).fetchall()
+        texts = [_load_blob(con, *row) for row in rows]
+    clean = []
+    for text in texts:
+        parts, pos = [], 0
+        for f in sorted(find_pii(text), key=lambda x: x["span"][0]):
+            s, e = f["span"]
+            if s >= pos:
+                parts.append(text[pos:s]); parts.append("\n")  # a line break ends every fragment
+                pos = e
+        parts.append(text[pos:])
+        clean.append("".join(parts).encode("utf-8"))
+    zdict = compression.train_zdict(clean, size)
+    if not zdict:
+        return None
+    with get_manager(db_path).transaction() as con:
+        return con.execute("INSERT INTO zdicts (created, samples, content) VALUES (?,?,?);",
+                           (datetime.datetime.utcnow().isoformat(), len(texts), zdict)).lastrowid
+
+def prune_snapshots(before_op_id: int, db_path: Optional[os.PathLike] = None) -> int:
+    """Drop the snapshots of operations with id < `before_op_id` (retention).
+
+    The operations and their hashes stay in the chain; the blobs lose one
+    reference per dropped snapshot and are reclaimed by `gc_blobs`.
+    """
+    with get_manager(db_path).transaction() as con:
+        con.execute("UPDATE blobs SET refcount=refcount-(SELECT COUNT(*) FROM snapshots WHERE blob_hash=blobs.hash AND op_id<?) "
+                    "WHERE hash IN (SELECT blob_hash FROM snapshots WHERE op_id<?);", (before_op_id, before_op_id))
+        return con.execute("DELETE FROM snapshots WHERE op_id<?;", (before_op_id,)).rowcount
+
+def gc_blobs(db_path: Optional[os.PathLike] = None, recount: bool = True, keep_latest_zdict: bool = True) -> Dict[str, int]:
+    """Delete blobs no snapshot or delta refers to, then chunks no blob uses,
+    then compression dictionaries no blob or chunk uses.
+
+    With `recount`, reference counts are first rebuilt from the snapshots
+    table, delta bases and chunk lists, which repairs counts left wrong by
+    manual edits. The newest dictionary is the one new "zlib-dict" writes
+    use; it is kept unless `keep_latest_zdict` is False. Returns the number
+    of blobs, chunks and dictionaries deleted, their bytes and the counts
+    fixed.
+    """
+    n = freed = fixed = 0
+    with get_manager(db_path).transaction() as con:
+        if recount:
+            refs = ("((SELECT COUNT(*) FROM snapshots WHERE blob_hash=blobs.hash)"
+                    " + (SELECT COUNT(*) FROM blobs d WHERE d.base=blobs.hash))")
+            fixed = con.execute(f"UPDATE blobs SET refcount={refs} WHERE refcount!={refs};").rowcount
+            refs = "(SELECT COUNT(*) FROM blob_chunks WHERE chunk_hash=chunks.hash)"
+            fixed += con.execute(f"UPDATE chunks SET refcount={refs} WHERE refcount!={refs};").rowcount
+        while True:
+            # a deleted delta releases its base, which may then be unreferenced too
+            dead = con.execute("SELECT hash, base, LENGTH(content) FROM blobs WHERE refcount<=0;").fetchall()
+            if not dead:
+                break
+            for h, base, size in dead:
+                con.execute("DELETE FROM blobs WHERE hash=?;", (h,))
+                if base is not None:
+                    con.execute("UPDATE blobs SET refcount=refcount-1 WHERE hash=?;", (base,))
+                con.execute("UPDATE chunks SET refcount=refcount-(SELECT COUNT(*) FROM blob_chunks WHERE blob_hash=? AND chunk_hash=chunks.hash) "
+                            "WHERE hash IN (SELECT chunk_hash FROM blob_chunks WHERE blob_hash=?);", (h, h))
+                con.execute("DELETE FROM blob_chunks WHERE blob_hash=?;", (h,))
+                n += 1; freed += size
+        chunks, chunk_bytes = con.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM chunks WHERE refcount<=0;").fetchone()
+        con.execute("DELETE FROM chunks WHERE refcount<=0;")
+        unused = ("FROM zdicts WHERE id NOT IN (SELECT dict_id FROM blobs WHERE dict_id IS NOT NULL)"
+                  " AND id NOT IN (SELECT dict_id FROM chunks WHERE dict_id IS NOT NULL)")
+        if keep_latest_zdict:
+            unused += " AND id != (SELECT MAX(id) FROM zdicts)"
+        zdicts, zdict_bytes = con.execute(f"SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) {unused};").fetchone()
+        con.execute(f"DELETE {unused};")
+    return {"deleted": n, "deleted_chunks": chunks, "deleted_zdicts": zdicts,
+            "freed_bytes": freed + chunk_bytes + zdict_bytes, "recounted": fixed}
+
+def verify_chain(db_path: Optional[os.PathLike] = None, max_errors: int = 20) -> Dict[str, Any]:
+    """Walk the whole chain: links (prev_chain_hash) and recomputed chain hashes.
+
+    Returns {"ok", "count", "errors"}; errors list the first `max_errors`
+    offending op ids with a reason.
+    """
+    errors: List[Dict[str, Any]] = []
+    count = 0
+    prev = None
+    with get_manager(db_path).reader() as con:
+        cur = con.execute("SELECT id, op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta FROM operations ORDER BY id;")
+        for op_id, op_time, user, action, file_path, bh, ah, prev_hash, chain_hash, meta in cur:
+            count += 1
+            payload = {"op_time": op_time, "user": user, "action": action, "file_path": file_path,
+                       "before_hash": bh, "after_hash": ah, "meta": json.loads(meta or "{}")}
+            if prev_hash != prev:
+                errors.append({"id": op_id, "error": "broken link"})
+            elif _calc_chain(prev_hash, payload) != chain_hash:
+                errors.append({"id": op_id, "error": "hash mismatch"})
+            prev = chain_hash
+            if len(errors) >= max_errors:
+                break
+    return {"ok": not errors, "count": count, "errors": errors}
+
+_OP_COLUMNS = "id, op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta"
+
+def _op_row(r) -> Dict[str, Any]:
+    return {"id": r[0], "op_time": r[1], "user": r[2], "action": r[3], "file_path": r[4],
+            "before_hash": r[5], "after_hash": r[6], "prev_chain_hash": r[7], "chain_hash": r[8],
+            "meta": json.loads(r[9] or "{}")}
+
+def query_operations(file_path: Optional[str] = None, user: Optional[str] = None, action: Optional[str] = None,
+                     before_hash: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                     cursor: Optional[int] = None, limit: int = 100, newest_first: bool = True,
+                     db_path: Optional[os.PathLike] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """One page of operations matching all given filters, plus the next cursor.
+
+    `since` / `until` bound op_time (ISO strings, inclusive / exclusive);
+    such queries are ordered by (op_time, id) so the time index serves both
+    the range and the order, otherwise by id. Pages are keyset-paginated:
+    pass the returned cursor (the last op id) to get the next page; it is
+    None after the last page. Every filter is backed by an index, so a page
+    costs about the same at row 10 or 10 million.
+    """
+    where, args = [], []
+    for col, val in (("file_path", file_path), ("user", user), ("action", action), ("before_hash", before_hash)):
+        if val is not None:
+            where.append(f"{col}=?"); args.append(val)
+    if since is not None:
+        where.append("op_time>=?"); args.append(since)
+    if until is not None:
+        where.append("op_time<?"); args.append(until)
+    by_time = since is not None or until is not None
+    cmp, order = ("<", "DESC") if newest_first else (">", "ASC")
+    if cursor is not None:
+        if by_time:
+            where.append(f"(op_time, id){cmp}(SELECT op_time, id FROM operations WHERE id=?)")
+        else:
+            where.append(f"id{cmp}?")
+        args.append(cursor)
+    sql = f"SELECT {_OP_COLUMNS} FROM operations"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {f'op_time {order}, ' if by_time else ''}id {order} LIMIT ?;"
+    with get_manager(db_path).reader() as con:
+        rows = con.execute(sql, (*args, limit + 1)).fetchall()
+    page = [_op_row(r) for r in rows[:limit]]
+    return page, (page[-1]["id"] if len(rows) > limit else None)
 
 def read_operation(op_id: int):
-    con = _connect()
-    cur = con.execute("SELECT id, op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta FROM operations WHERE id=?;", (op_id,))
-    op = cur.fetchone()
-    if not op: return None
-    s_cur = con.execute("SELECT kind, content FROM snapshots WHERE op_id=?;", (op_id,))
-    snaps = dict(s_cur.fetchall())
+    with get_manager().reader() as con:
+        cur = con.execute(f"SELECT {_OP_COLUMNS} FROM operations WHERE id=?;", (op_id,))
+        op = cur.fetchone()
+        if not op: return None
+        snaps = _read_snapshots(con, op_id)
     return {
-        "operation": {
-            "id": op[0], "op_time": op[1], "user": op[2], "action": op[3], "file_path": op[4],
-            "before_hash": op[5], "after_hash": op[6], "prev_chain_hash": op[7], "chain_hash": op[8],
-            "meta": json.loads(op[9] or "{}")
-        },
-        "snapshots": { k: _decompress(v) for k,v in snaps.items() }
+        "operation": _op_row(op),
+        "snapshots": snaps
     }
 
 def export_chain_html(dest_path: os.PathLike):
-    con = _connect()
-    rows = list(con.execute("SELECT id, op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta FROM operations ORDER BY id;"))
+    with get_manager().reader() as con:
+        rows = list(con.execute("SELECT id, op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta FROM operations ORDER BY id;"))
     html = ["<html><head><meta charset='utf-8'><title>Audit Chain</title><style>body{font-family:Arial} code{word-break:break-all}</style></head><body>"]
     html.append("<h1>PrivAuditRedactor 审计链报告</h1>")
     html.append(f"<p>导出时间（UTC）：{datetime.datetime.utcnow().isoformat()}</p>")
@@ -129,8 +1047,8 @@ def export_chain_html(dest_path: os.PathLike):
 
 
 def export_chain_html_with_stats(dest_path: os.PathLike):
-    con = _connect()
-    rows = list(con.execute("SELECT id, op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta FROM operations ORDER BY id;"))
+    with get_manager().reader() as con:
+        rows = list(con.execute("SELECT id, op_time, user, action, file_path, before_hash, after_hash, prev_chain_hash, chain_hash, meta FROM operations ORDER BY id;"))
     # compute stats
     total = len(rows)
     by_user = {}
@@ -0,0 +1,53 @@
+"""
+Content-defined chunking for the "chunked" snapshot backend.
+
+Chunk boundaries come from a gear rolling hash over the bytes, so they
+depend on the content around them rather than on offsets: appending to a
+log, or editing it in one place, leaves the other chunks unchanged and
+they are stored only once.
+
+Developer notes:
+- Sizes: no cut before MIN_CHUNK bytes, a forced cut at MAX_CHUNK, about
+  2**AVG_BITS bytes on average in between.
+- The gear table is derived from SHA-256 so chunking is identical across
+  Python versions and machines; changing it (or the sizes) changes every
+  boundary, so stored chunks stop being shared with new ones.
+- Pure Python, roughly 5-10 MB/s; only texts of CHUNKED_MIN_BYTES or more
+  are chunked.
+"""
+
+import hashlib
+from typing import Iterator
+
+MIN_CHUNK = 2 * 1024
+AVG_BITS = 13  # 8 KiB
+MAX_CHUNK = 64 * 1024
+CHUNKED_MIN_BYTES = 4 * MIN_CHUNK
+
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], "big") for i in range(256)]
+
+
+def chunk_ends(data: bytes, min_size: int = MIN_CHUNK, avg_bits: int = AVG_BITS, max_size: int = MAX_CHUNK) -> Iterator[int]:
+    """End offset of every chunk of `data` (the last one is len(data))."""
+    mask = ((1 << avg_bits) - 1) << (32 - avg_bits)  # top bits: they mix the last 32 bytes
+    gear = GEAR
+    n, start = len(data), 0
+    while start < n:
+        end = min(n, start + max_size)
+        i = min(end, start + min_size)
+        h = 0
+        for b in data[i:end]:
+            h = ((h << 1) + gear[b]) & 0xFFFFFFFF
+            i += 1
+            if not h & mask:
+                break
+        yield i
+        start = i
+
+
+def iter_chunks(data: bytes) -> Iterator[memoryview]:
+    view = memoryview(data)
+    start = 0
+    for end in chunk_ends(data):
+        yield view[start:end]
+        start = end
@@ -0,0 +1,121 @@
+"""
+Compression codecs for snapshot blobs and chunks.
+
+Every stored blob records the codec name it was written with (and, for
+dictionary codecs, the id of the preset dictionary), so the default can
+change without old data becoming unreadable.
+
+Developer notes:
+- A codec is compress(data, zdict) / decompress(data, zdict); zdict is None
+  for codecs registered without `uses_dict`. An optional `compressor(zdict)`
+  factory returns a streaming object (compress/flush) producing the same
+  format, so large texts can be compressed slice by slice.
+- "zlib-dict" is zlib with a preset dictionary (`zdict`). Small templated
+  files share most of their text with each other but too little with
+  themselves for plain zlib; `train_zdict` collects the recurring text.
+- Never change what an existing name produces: register a new name instead.
+"""
+
+import bz2, lzma, re, zlib
+from collections import Counter
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+DEFAULT_CODEC = "zlib"
+ZDICT_SIZE = 32 * 1024  # zlib only looks back 32 KiB
+
+CODECS: Dict[str, Tuple[Callable, Callable, bool, Optional[Callable]]] = {}
+
+
+def register_codec(name: str, compress: Callable, decompress: Callable, uses_dict: bool = False,
+                   compressor: Optional[Callable] = None):
+    CODECS[name] = (compress, decompress, uses_dict, compressor)
+
+
+class _Buffered:
+    # streaming interface for codecs that only compress in one shot
+    def __init__(self, compress: Callable, zdict: Optional[bytes]):
+        self._compress, self._zdict, self._parts = compress, zdict, []
+
+    def compress(self, data: bytes) -> bytes:
+        self._parts.append(data)
+        return b""
+
+    def flush(self) -> bytes:
+        return self._compress(b"".join(self._parts), self._zdict)
+
+
+def _zlib(level: int):
+    return lambda data, zdict: zlib.compress(data, level)
+
+
+def _zlib_stream(level: int):
+    return lambda zdict: zlib.compressobj(level)
+
+
+def _zlib_dict_compress(data: bytes, zdict: bytes) -> bytes:
+    c = zlib.compressobj(9, zdict=zdict)
+    return c.compress(data) + c.flush()
+
+
+def _zlib_dict_decompress(data: bytes, zdict: bytes) -> bytes:
+    d = zlib.decompressobj(zdict=zdict)
+    return d.decompress(data) + d.flush()
+
+
+register_codec("zlib", _zlib(-1), lambda data, zdict: zlib.decompress(data), compressor=_zlib_stream(-1))  # what every pre-registry blob used
+register_codec("zlib-1", _zlib(1), lambda data, zdict: zlib.decompress(data), compressor=_zlib_stream(1))
+register_codec("zlib-9", _zlib(9), lambda data, zdict: zlib.decompress(data), compressor=_zlib_stream(9))
+register_codec("lzma", lambda data, zdict: lzma.compress(data), lambda data, zdict: lzma.decompress(data),
+               compressor=lambda zdict: lzma.LZMACompressor())
+register_codec("bz2", lambda data, zdict: bz2.compress(data, 9), lambda data, zdict: bz2.decompress(data),
+               compressor=lambda zdict: bz2.BZ2Compressor(9))
+register_codec("zlib-dict", _zlib_dict_compress, _zlib_dict_decompress, uses_dict=True,
+               compressor=lambda zdict: zlib.compressobj(9, zdict=zdict))
+
+
+def uses_dict(codec: str) -> bool:
+    return _codec(codec)[2]
+
+
+def _codec(name: str) -> Tuple[Callable, Callable, bool, Optional[Callable]]:
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"unknown codec: {name}") from None
+
+
+def compress(codec: str, data: bytes, zdict: Optional[bytes] = None) -> bytes:
+    return _codec(codec)[0](data, zdict)
+
+
+def decompress(codec: str, data: bytes, zdict: Optional[bytes] = None) -> bytes:
+    return _codec(codec)[1](data, zdict)
+
+
+def compressor(codec: str, zdict: Optional[bytes] = None):
+    """Streaming compressor (compress(piece) / flush()) whose output `decompress` reads."""
+    c = _codec(codec)
+    return c[3](zdict) if c[3] is not None else _Buffered(c[0], zdict)
+
+
+# template text: the runs between numbers, line breaks and mask characters (masked values stay out)
+_FRAGMENT = re.compile(rb"[^\d\n*]{6,256}")
+
+
+def train_zdict(samples: Iterable[bytes], size: int = ZDICT_SIZE) -> bytes:
+    """Preset dictionary of the text fragments shared by most `samples`.
+
+    Fragments are scored by (documents containing them - 1) * length, so
+    text seen in one document only is never picked. The best fragments go
+    last, where zlib reaches them with the shortest distances.
+    """
+    docs = Counter()
+    for sample in samples:
+        docs.update(set(_FRAGMENT.findall(sample)))
+    picked, total = [], 0
+    for frag, n in sorted(docs.items(), key=lambda kv: (-(kv[1] - 1) * len(kv[0]), kv[0])):
+        if n < 2 or total + len(frag) > size:
+            continue
+        picked.append(frag)
+        total += len(frag)
+    return b"".join(reversed(picked))
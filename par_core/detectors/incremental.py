@@ -0,0 +1,135 @@
+"""
+Incremental re-detection for edited documents.
+
+Given the text and core findings of a previous run, only the regions that
+changed are scanned again; findings in untouched regions are carried over
+with their offsets shifted.
+
+Developer notes:
+- Blocks are lines: the diff is a SequenceMatcher over the two line lists.
+- Every changed region is widened by `margin` characters and snapped to line
+  boundaries. A window is widened again while a match reaches its end or a
+  carried-over finding straddles one of its edges.
+- The result equals a full `find_pii` for any match shorter than `margin`;
+  keep the margin above the longest match the active rules can produce.
+"""
+
+import bisect
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from .patterns import find_pii, dedupe_findings
+
+DEFAULT_MARGIN = 1024
+
+
+def _offsets(lines: List[str]) -> List[int]:
+    offs = [0]
+    for line in lines:
+        offs.append(offs[-1] + len(line))
+    return offs
+
+
+def _line_start(text: str, i: int) -> int:
+    return text.rfind("\n", 0, max(0, i)) + 1
+
+
+def _line_end(text: str, i: int) -> int:
+    j = text.find("\n", max(0, i))
+    return len(text) if j < 0 else j + 1
+
+
+def rescan(old_text: str, old_findings: List[Dict[str, Any]], new_text: str,
+           extra_patterns: Optional[List[Tuple[str, Pattern]]] = None,
+           margin: int = DEFAULT_MARGIN) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+    """Core findings for `new_text`, re-running detection on changed regions only.
+
+    `old_findings` are the deduplicated `find_pii` results for `old_text` under
+    the same rules. Returns (findings, characters scanned); findings is None
+    when most of the text changed and a full scan is the cheaper option.
+    """
+    a = old_text.splitlines(keepends=True)
+    b = new_text.splitlines(keepends=True)
+    ao, bo = _offsets(a), _offsets(b)
+    moves: List[Tuple[int, int, int]] = []  # (old start, old end, shift) of unchanged blocks
+    wins: List[List[int]] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b).get_opcodes():
+        if tag == "equal":
+            moves.append((ao[i1], ao[i2], bo[j1] - ao[i1]))
+        else:
+            wins.append([_line_start(new_text, bo[j1] - margin), _line_end(new_text, bo[j2] + margin)])
+
+    # carried-over findings, in new-text offsets (still sorted and non-overlapping)
+    starts = [m[0] for m in moves]
+    kept: List[Dict[str, Any]] = []
+    for f in sorted(old_findings, key=lambda x: x["span"][0]):
+        s, e = f["span"]
+        k = bisect.bisect_right(starts, s) - 1
+        if k >= 0 and e <= moves[k][1]:
+            d = moves[k][2]
+            kept.append({"type": f["type"], "span": (s + d, e + d)})
+    kstarts = [f["span"][0] for f in kept]
+
+    def straddling(pos: int) -> Optional[Tuple[int, int]]:
+        k = bisect.bisect_left(kstarts, pos) - 1
+        if k >= 0 and kept[k]["span"][1] > pos:
+            return kept[k]["span"]
+        return None
+
+    n = len(new_text)
+    if not wins:
+        found, scanned, windows = [], 0, []
+    else:
+        wins.sort()
+        merged = [wins[0]]
+        for w in wins[1:]:
+            if w[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], w[1])
+            else:
+                merged.append(w)
+        if sum(we - ws for ws, we in merged) * 2 > n:
+            return None, 0
+        found, scanned, windows = [], 0, []
+        k = 0
+        while k < len(merged):
+            ws, we = merged[k]
+            left, right = straddling(ws), straddling(we)
+            grow_to = None
+            if left:
+                ws = _line_start(new_text, left[0])
+            if right:
+                grow_to = right[1]
+            fs = None
+            if not grow_to:
+                fs = find_pii(new_text, extra_patterns, ws, we)
+                if we < n and any(f["span"][1] >= we for f in fs):
+                    grow_to = we + margin  # the match may continue past the window
+            if grow_to:
+                we = _line_end(new_text, grow_to)
+                while k + 1 < len(merged) and merged[k + 1][0] <= we:
+                    we = max(we, merged.pop(k + 1)[1])
+            merged[k] = [ws, we]
+            if fs is None or grow_to or left:
+                if k > 0 and ws <= merged[k - 1][1]:
+                    # grew back into the previous window: redo both as one
+                    merged[k - 1][1] = max(merged[k - 1][1], merged.pop(k)[1])
+                    k -= 1
+                    found = [f for f in found if f["span"][0] < windows[-1][0]]
+                    scanned -= windows[-1][1] - windows[-1][0]
+                    windows.pop()
+                continue
+            found.extend(fs)
+            windows.append((ws, we))
+            scanned += we - ws
+            k += 1
+
+    wstarts = [w[0] for w in windows]
+
+    def outside(span: Tuple[int, int]) -> bool:
+        k = bisect.bisect_right(wstarts, span[0]) - 1
+        if k >= 0 and span[0] < windows[k][1]:
+            return False
+        return k + 1 >= len(windows) or span[1] <= windows[k + 1][0]
+
+    carried = [dict(f, text=new_text[f["span"][0]:f["span"][1]]) for f in kept if outside(f["span"])]
+    return dedupe_findings(carried + found), scanned
@@ -13,8 +13,8 @@ Developer notes:
 
 # Human comment: legacy compatibility layer below.
 
-import re
-from typing import List, Tuple, Pattern, Dict, Any
+import re, csv, hashlib, pathlib
+from typing import List, Tuple, Pattern, Dict, Any, Iterable, Optional
 
 # Try to import an extended huge ruleset if present
 try:
@@ -40,6 +40,24 @@ for r in HUGE_RULES:
 PATTERNS.extend(BASE_PATTERNS)
 
 
+_CORE_FINGERPRINT = None
+
+
+def ruleset_fingerprint(extra_patterns: Optional[List[Tuple[str, Pattern]]] = None) -> str:
+    """Stable hash of the active rules (names, sources, flags) for cache keys."""
+    global _CORE_FINGERPRINT
+    def digest(pats):
+        h = hashlib.sha256()
+        for name, pat in pats:
+            h.update(f"{name}\0{getattr(pat, 'pattern', pat)}\0{getattr(pat, 'flags', 0)}\n".encode("utf-8"))
+        return h.hexdigest()
+    if _CORE_FINGERPRINT is None:
+        _CORE_FINGERPRINT = digest(PATTERNS)
+    if not extra_patterns:
+        return _CORE_FINGERPRINT
+    return hashlib.sha256((_CORE_FINGERPRINT + digest(extra_patterns)).encode("ascii")).hexdigest()
+
+
 def luhn_check(number: str) -> bool:
     s = 0
     alt = False
@@ -54,15 +72,41 @@ def luhn_check(number: str) -> bool:
     return s % 10 == 0
 
 
-def find_pii(text: str) -> List[Dict[str, Any]]:
+def compile_rules(rules: Iterable[Dict[str, Any]]) -> List[Tuple[str, Pattern]]:
+    """Turn rule dicts (huge_rules / rules_catalog.csv shape) into (name, pattern) pairs."""
+    res = []
+    for r in rules:
+        try:
+            rx = r["regex"]
+            res.append((r["name"], rx if hasattr(rx, "finditer") else re.compile(rx)))
+        except Exception as e:
+            print(f"[RuleError] {r.get('name')}: {e}")
+    return res
+
+
+def load_rules_csv(path: pathlib.Path) -> List[Dict[str, Any]]:
+    # Same columns as rules_catalog.csv: name,regex,example,description
+    with open(path, newline="", encoding="utf-8") as fh:
+        return [{"name": row["name"], "regex": row["regex"], "example": row.get("example"),
+                 "desc": row.get("description")} for row in csv.DictReader(fh) if row.get("name")]
+
+
+def find_pii(text: str, extra_patterns: Optional[List[Tuple[str, Pattern]]] = None,
+             pos: int = 0, endpos: Optional[int] = None) -> List[Dict[str, Any]]:
+    # pos/endpos limit the scan to text[pos:endpos] with offsets into the whole text
+    endpos = len(text) if endpos is None else endpos
     findings = []
-    for name, pat in PATTERNS:
-        for m in pat.finditer(text):
+    for name, pat in (PATTERNS + extra_patterns if extra_patterns else PATTERNS):
+        for m in pat.finditer(text, pos, endpos):
             span_text = m.group(0)
             if name == "bank_card" and not luhn_check(span_text):
                 continue
             findings.append({"type": name, "span": (m.start(), m.end()), "text": span_text})
-    # dedupe overlapping by start-end
+    return dedupe_findings(findings)
+
+
+def dedupe_findings(findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # dedupe overlapping by start-end; the longest span at each start wins
     findings_sorted = sorted(findings, key=lambda x: (x["span"][0], -x["span"][1]))
     res = []
     last_end = -1
@@ -0,0 +1,213 @@
+"""
+Staged asyncio pipeline: read -> detect -> write -> audit.
+
+File reads and output writes run in a thread pool, detection and redaction run
+in a process pool (see par_core.batch), and a single audit task commits records
+through a dedicated one-thread executor. Stages are connected by bounded
+queues, so a slow stage applies backpressure instead of letting memory grow.
+
+Developer notes:
+- Each stage keeps `StageStats`: items, errors, busy time, current and peak
+  depth of its input queue. `Pipeline.report()` turns them into throughput
+  numbers; the stage with the fullest input queue is the bottleneck.
+- Audit records are chained in the order files leave the write stage; the
+  input position is stored in meta as `seq`.
+- A failed audit commit is retried record by record; files whose record
+  still fails are counted as audit errors and reported to `on_result` as
+  `{"error": ..., "output": dest}` (their output is already written).
+- `prepare=True` hashes and compresses a group's snapshots in the audit
+  writer's threads before handing the group to the audit executor.
+"""
+
+import asyncio, os, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from par_core.batch import make_process_pool, _redact_text_job
+from par_core.db import AuditWriter
+from par_core.utils.metrics import PLUGIN_METRICS
+from par_core.utils.pool import DEFAULT_TIMEOUT
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.depth = 0
+        self.max_depth = 0
+
+    def as_dict(self, elapsed: float) -> Dict[str, Any]:
+        return {"items": self.items, "errors": self.errors, "busy_s": round(self.busy, 3),
+                "queue_depth": self.depth, "max_queue_depth": self.max_depth,
+                "items_per_s": round(self.items / elapsed, 2) if elapsed > 0 else 0.0}
+
+
+class Pipeline:
+    def __init__(self, jobs: int=None, io_workers: int=4, queue_size: int=64, user: str="user", strategy: str="smart",
+                 plugins_dir: Path=None, plugin_mode: str="inproc", commit_every: int=64, audit: AuditWriter=None,
+                 plugin_timeout: float=DEFAULT_TIMEOUT, prepare: bool=False):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.io_workers = io_workers
+        self.queue_size = queue_size
+        self.user = user
+        self.strategy = strategy
+        self.plugins_dir = plugins_dir
+        self.plugin_mode = plugin_mode
+        self.plugin_timeout = plugin_timeout
+        self.prepare = prepare
+        self.commit_every = max(1, commit_every)
+        self.audit = audit or AuditWriter()
+        self.stats = {n: StageStats(n) for n in ("read", "detect", "write", "audit")}
+        self._started = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        for name, q in self._queues.items():
+            self.stats[name].depth = q.qsize()
+        return {"elapsed_s": round(elapsed, 3), "stages": {n: s.as_dict(elapsed) for n, s in self.stats.items()}}
+
+    async def _put(self, name: str, item):
+        # `name` is the stage that consumes the queue
+        q = self._queues[name]
+        await q.put(item)
+        st = self.stats[name]
+        st.max_depth = max(st.max_depth, q.qsize())
+
+    async def _stage(self, name: str, fn, next_name: str, workers: int):
+        st = self.stats[name]
+        inq = self._queues[name]
+
+        async def worker():
+            while True:
+                item = await inq.get()
+                if item is _DONE:
+                    await inq.put(_DONE)  # let sibling workers see it too
+                    return
+                t0 = time.monotonic()
+                try:
+                    res = await fn(item)
+                except Exception as e:
+                    st.errors += 1
+                    print(f"[PipelineError] {name} {item[1]}: {e}")
+                    continue
+                finally:
+                    st.busy += time.monotonic() - t0
+                st.items += 1
+                await self._put(next_name, res)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        await self._put(next_name, _DONE)
+
+    async def run(self, items: Iterable[Tuple[Path, Path]], on_result: Callable=None,
+                  report_every: float=None, on_report: Callable=None) -> Dict[str, Any]:
+        """Process (src, dest) pairs; returns the final stage report."""
+        loop = asyncio.get_running_loop()
+        self._started = time.monotonic()
+        self._queues = {n: asyncio.Queue(self.queue_size) for n in self.stats}
+        audit_q = self._queues["audit"]
+        io = ThreadPoolExecutor(self.io_workers, thread_name_prefix="par-io")
+        db = ThreadPoolExecutor(1, thread_name_prefix="par-audit")
+        procs = make_process_pool(self.jobs, self.strategy, self.plugins_dir, self.plugin_mode, self.plugin_timeout)
+
+        async def read(item):
+            seq, src, dest = item
+            text = await loop.run_in_executor(io, lambda: Path(src).read_text(encoding="utf-8", errors="ignore"))
+            return seq, src, dest, text
+
+        async def detect(item):
+            seq, src, dest, text = item
+            (findings, redacted), metrics = await loop.run_in_executor(procs, _redact_text_job, text)
+            PLUGIN_METRICS.merge(metrics)
+            return seq, src, dest, text, findings, redacted
+
+        async def write(item):
+            seq, src, dest, text, findings, redacted = item
+            await loop.run_in_executor(io, lambda: Path(dest).write_text(redacted, encoding="utf-8"))
+            return item
+
+        async def audit():
+            from par_core.service import build_op
+            st = self.stats["audit"]
+            batch: List[tuple] = []
+            done = False
+            while not done:
+                item = await audit_q.get()
+                if item is _DONE:
+                    done = True
+                else:
+                    batch.append(item)
+                # commit a full group, or whatever is buffered once the queue runs dry
+                if batch and (done or len(batch) >= self.commit_every or audit_q.empty()):
+                    ops = [build_op(self.user, self.strategy, str(src), text, findings, redacted, seq=seq)
+                           for seq, src, dest, text, findings, redacted in batch]
+                    if self.prepare:
+                        ops = [self.audit.prepare(op) for op in ops]
+                    def record(group):
+                        return self.audit.record_many([op.result() if isinstance(op, Future) else op for op in group])
+                    def record_each():
+                        # the group was rolled back as a whole: retry op by op so only the culprit is lost
+                        res = []
+                        for op in ops:
+                            try:
+                                res.extend(record([op]))
+                            except Exception as err:
+                                res.append(err)
+                        return res
+                    t0 = time.monotonic()
+                    try:
+                        ids = await loop.run_in_executor(db, record, ops)
+                    except Exception as e:
+                        print(f"[PipelineError] audit: {e}")
+                        ids = await loop.run_in_executor(db, record_each)
+                    st.busy += time.monotonic() - t0
+                    for (seq, src, dest, _, findings, _), rec in zip(batch, ids):
+                        if isinstance(rec, Exception):
+                            st.errors += 1
+                            print(f"[PipelineError] audit {src}: {rec}")
+                            if on_result:
+                                on_result(src, {"error": str(rec), "output": dest})
+                            continue
+                        st.items += 1
+                        if on_result:
+                            op_id, chain_hash = rec
+                            on_result(src, {"op_id": op_id, "chain_hash": chain_hash, "findings": findings, "output": dest})
+                    batch = []
+
+        async def feed():
+            for seq, (src, dest) in enumerate(items):
+                await self._put("read", (seq, src, dest))
+            await self._put("read", _DONE)
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(report_every)
+                on_report(self.report())
+
+        rep = asyncio.ensure_future(reporter()) if report_every and on_report else None
+        try:
+            await asyncio.gather(
+                feed(),
+                self._stage("read", read, "detect", self.io_workers),
+                self._stage("detect", detect, "write", self.jobs),
+                self._stage("write", write, "audit", self.io_workers),
+                audit(),
+            )
+        finally:
+            if rep:
+                rep.cancel()
+            procs.shutdown()
+            io.shutdown()
+            db.shutdown()
+        return self.report()
+
+
+def run_pipeline(items: Iterable[Tuple[Path, Path]], on_result: Callable=None, report_every: float=None,
+                 on_report: Callable=None, **kwargs) -> Dict[str, Any]:
+    """Synchronous entry point; `kwargs` are passed to `Pipeline`."""
+    return asyncio.run(Pipeline(**kwargs).run(items, on_result, report_every, on_report))
@@ -1,31 +1,365 @@
 """
 High-level processing service.
 
-Exposes `process_file` which orchestrates extraction, detection, transformation
-and auditing. This is deliberately kept small; major logic is delegated to
+Exposes the `Redactor` engine and the `process_file` / `process_files`
+shortcuts, which orchestrate extraction, detection, transformation and
+auditing. This is deliberately kept small; major logic is delegated to
 par_core.detectors and par_core.transformers modules.
 """
 
 # Developer note: keep progress callbacks lightweight so GUI remains responsive.
 
 
+import json, threading
+from collections import Counter
 from pathlib import Path
-from typing import Dict, Any
-from par_core.detectors.patterns import find_pii
-from par_core.transformers.redact import redact
-from par_core.db import record_operation
-from par_core.utils.misc import load_plugins, apply_plugin_detectors, apply_plugin_transformers, text_diff
-
-def process_file(path: Path, user: str="user", strategy: str="smart", plugins_dir: Path=None) -> Dict[str, Any]:
-    text = path.read_text(encoding="utf-8", errors="ignore")
-    findings = find_pii(text)
-    plugins = load_plugins(plugins_dir or (Path(__file__).resolve().parents[2] / "plugins"))
-    findings += apply_plugin_detectors(plugins, text)
-    redacted = redact(text, findings, strategy=strategy)
-    redacted = apply_plugin_transformers(plugins, redacted, findings)
-    meta = {"strategy": strategy, "findings": len(findings)}
-    op_id, chain_hash = record_operation(user=user, action="redact", file_path=str(path), before_text=text, after_text=redacted, meta=meta)
-    return {
-        "op_id": op_id, "chain_hash": chain_hash, "findings": findings, 
-        "redacted": redacted, "diff": text_diff(text, redacted)
-    }
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from par_core.detectors.patterns import find_pii, dedupe_findings, ruleset_fingerprint
+from par_core.detectors.incremental import rescan, DEFAULT_MARGIN
+from par_core.transformers.redact import redact_spans, applied_edits, POLICY_FINGERPRINT
+from par_core.db import AuditWriter
+from par_core.cache import ResultCache, config_key
+from par_core.utils.pool import get_plugin_pool, DEFAULT_TIMEOUT
+from par_core.utils.misc import get_plugins, plugin_rules, plugin_fingerprint, start_plugin_detectors, apply_plugin_replacements, apply_plugin_transformers_many, redaction_diff, iter_redaction_diff
+
+def redact_texts(texts: List[str], strategy: str="smart", plugins=(), core: List[Optional[list]]=None) -> List[Tuple[List[Dict[str, Any]], str]]:
+    """Detect and redact a batch of documents; returns (findings, redacted) per text.
+
+    `core` may carry already known core (`find_pii`) findings per text; None
+    entries are scanned here.
+    """
+    rules = plugin_rules(plugins)
+    # pool-backed plugins detect concurrently with the core scan below
+    collect = start_plugin_detectors(plugins, texts)
+    core = [find_pii(text, rules) if found is None else found for text, found in zip(texts, core or [None] * len(texts))]
+    merged, redacted, shifted = [], [], []
+    for text, found, extra in zip(texts, core, collect()):
+        # core and plugin spans are merged once, then written in a single pass
+        findings = dedupe_findings(found + extra)
+        apply_plugin_replacements(plugins, findings)
+        r, sh = redact_spans(text, findings, strategy=strategy)
+        merged.append(findings); redacted.append(r); shifted.append(sh)
+    redacted = apply_plugin_transformers_many(plugins, redacted, shifted)
+    return list(zip(merged, redacted))
+
+def load_plugin_set(plugins_dir: Path=None, plugin_mode: str="inproc", plugin_timeout: float=DEFAULT_TIMEOUT) -> list:
+    """Plugins for `plugins_dir`: cached modules ("inproc") or worker proxies ("pool")."""
+    plugins_dir = plugins_dir or (Path(__file__).resolve().parents[2] / "plugins")
+    if plugin_mode == "pool":
+        return get_plugin_pool(plugins_dir, plugin_timeout).plugins
+    if plugin_mode != "inproc":
+        raise ValueError(f"unknown plugin mode: {plugin_mode}")
+    return get_plugins(plugins_dir)
+
+RESULT_SHAPES = ("full", "lean", "stream")
+
+class LazyResult(dict):
+    """Result dict whose "diff" is only built when it is read.
+
+    "lean" results compute the diff string once on first access; "stream"
+    results hand out a fresh iterator of diff lines on every access. Either
+    way the original text stays referenced until the result is dropped.
+    """
+
+    def __init__(self, data: Dict[str, Any], text: str, redacted: str, findings, strategy: str, stream: bool=False):
+        super().__init__(data)
+        self._diff_args = (text, redacted, findings, strategy)
+        self._stream = stream
+
+    def __missing__(self, key):
+        if key != "diff":
+            raise KeyError(key)
+        if self._stream:
+            return iter_redaction_diff(*self._diff_args)
+        diff = self["diff"] = redaction_diff(*self._diff_args)
+        return diff
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+def shape_result(result: str, text: Optional[str], findings, redacted: str, strategy: str="smart", **data) -> Dict[str, Any]:
+    """Result dict in one of RESULT_SHAPES.
+
+    "full" carries the findings (with matched text) and the diff; "lean" and
+    "stream" carry per-type finding counts and a lazy diff (see LazyResult).
+    Diffs are derived from the findings' spans (`redaction_diff`).
+    """
+    if result == "full":
+        return {**data, "findings": findings, "redacted": redacted,
+                "diff": redaction_diff(text, redacted, findings, strategy) if text is not None else None}
+    if result not in RESULT_SHAPES:
+        raise ValueError(f"unknown result shape: {result}")
+    data.update(findings=dict(Counter(f["type"] for f in findings)), redacted=redacted)
+    if text is None:
+        return dict(data, diff=None)
+    return LazyResult(data, text, redacted, findings, strategy, stream=result == "stream")
+
+def build_op(user: str, strategy: str, file_path: str, text: str, findings, redacted: str, **meta) -> Dict[str, Any]:
+    """Keyword arguments for AuditWriter.record / record_many for one redaction.
+
+    The applied edits go along so the audit DB can store `after` as a delta
+    against `before` (it checks them against the redacted text first).
+    """
+    meta = {"strategy": strategy, "findings": len(findings), **meta}
+    edits = [(f["span"][0], f["span"][1] - f["span"][0], rep) for f, rep in applied_edits(text, findings, strategy)]
+    return {"user": user, "action": "redact", "file_path": file_path,
+            "before_text": text, "after_text": redacted, "meta": meta, "after_edits": edits}
+
+class Redactor:
+    """Reusable redaction engine.
+
+    Owns the masking strategy, the plugin set (through the process-wide
+    registry or worker pool, so plugin edits are still picked up) and an
+    `AuditWriter` with one initialised connection. Construction does the setup
+    once; instances can be shared across threads.
+
+    With `incremental` (off by default), file results also store their
+    findings, and a file whose previous redaction used the same configuration
+    is only rescanned where it changed (see par_core.detectors.incremental).
+    Plugins with detect hooks see whole texts, so they turn this off.
+
+    `result` is the default result shape: "full" (findings with matched
+    text, eager diff), "lean" (finding counts per type, diff built on first
+    access) or "stream" (like lean, the diff is an iterator of lines).
+
+    `durability` is the profile ("strict" or "grouped", see AuditWriter) of
+    the writer the Redactor creates when no `audit` is given.
+
+    `prepare` hashes and compresses snapshots in the audit writer's threads
+    while the next batch is detected. It pays off with several cores and
+    large texts; on one core the handoff makes commits slower, so it is off
+    by default.
+    """
+
+    def __init__(self, strategy: str="smart", plugins_dir: Path=None, plugin_mode: str="inproc",
+                 plugin_timeout: float=DEFAULT_TIMEOUT, audit: AuditWriter=None, user: str="user", batch_size: int=32,
+                 commit_every: int=64, cache: ResultCache=None, incremental: bool=False, margin: int=DEFAULT_MARGIN,
+                 result: str="full", prepare: bool=False, durability: str="strict"):
+        self.strategy = strategy
+        self.plugins_dir = plugins_dir
+        self.plugin_mode = plugin_mode
+        self.plugin_timeout = plugin_timeout
+        self.audit = audit or AuditWriter(durability=durability)
+        self.user = user
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.cache = cache
+        self.incremental = incremental
+        self.margin = margin
+        self.result = result
+        self.prepare = prepare
+        plugin_rules(self.plugins)  # load plugins and compile their rules up front
+
+    @property
+    def plugins(self) -> list:
+        return load_plugin_set(self.plugins_dir, self.plugin_mode, self.plugin_timeout)
+
+    def redact_many(self, texts: List[str]) -> List[Tuple[List[Dict[str, Any]], str]]:
+        return redact_texts(texts, self.strategy, self.plugins)
+
+    def _op(self, file_path: str, text: str, findings, redacted: str, user: str=None, **meta) -> Dict[str, Any]:
+        return build_op(user or self.user, self.strategy, file_path, text, findings, redacted, **meta)
+
+    def _incremental_ok(self, plugins) -> bool:
+        return self.incremental and not any(hasattr(p, "detect") or hasattr(p, "detect_many") for p in plugins)
+
+    def _rescan(self, e: Dict[str, Any], config: str, rules) -> Optional[List[Dict[str, Any]]]:
+        # core findings from the previous redaction of this path, or None for a full scan
+        prev = self.audit.latest(str(e["path"]), kinds=("before", "findings"))
+        if prev is None or prev["meta"].get("config") != config:
+            return None
+        snaps = prev["snapshots"]
+        if "before" not in snaps or "findings" not in snaps:
+            return None
+        old = [{"type": t, "span": (s, end)} for t, s, end in json.loads(snaps["findings"])]
+        found, scanned = rescan(snaps["before"], old, e["text"], rules, self.margin)
+        if found is not None:
+            e["incremental"] = {"base": prev["op_id"], "rescanned": scanned}
+        return found
+
+    def process_text(self, text: str, file_path: str=None, user: str=None, result: str=None) -> Dict[str, Any]:
+        (findings, redacted), = self.redact_many([text])
+        op_id, chain_hash = self.audit.record(**self._op(file_path, text, findings, redacted, user))
+        return shape_result(result or self.result, text, findings, redacted, self.strategy, op_id=op_id, chain_hash=chain_hash)
+
+    def process_file(self, path: Path, user: str=None, result: str=None) -> Dict[str, Any]:
+        (_, res), = self.process_many([path], user, commit_every=1, result=result)
+        return res
+
+    def config_fingerprint(self, plugins=None) -> str:
+        """Everything besides the content that decides the redacted output."""
+        plugins = self.plugins if plugins is None else plugins
+        return config_key(ruleset_fingerprint(plugin_rules(plugins)), self.strategy, POLICY_FINGERPRINT, plugin_fingerprint(plugins))
+
+    def _read(self, p: Path, config: str) -> Dict[str, Any]:
+        # one input file -> pending entry; cache hits skip detection entirely
+        if self.cache is None:
+            return {"path": p, "text": p.read_text(encoding="utf-8", errors="ignore")}
+        content_hash, text, stat = self.cache.read(p)
+        hit = self.cache.lookup(content_hash, config)
+        if hit is None and text is None:
+            text = p.read_text(encoding="utf-8", errors="ignore")
+        return {"path": p, "text": text, "hash": content_hash, "hit": hit, "stat": stat, "stale_stat": text is not None}
+
+    def _finish(self, e: Dict[str, Any], op_id, chain_hash, config: str, result: str) -> Dict[str, Any]:
+        hit = e.get("hit")
+        if self.cache is not None:
+            if hit is None:
+                self.cache.store(e["hash"], config, op_id, e["redacted"], e["findings"])
+            if e["stale_stat"]:
+                self.cache.remember(e["path"], e["hash"], e["stat"])
+        if hit is not None:
+            # the cache keeps type and span only; the matched text is there when the file was read
+            findings = hit["findings"]
+            if result == "full" and e["text"] is not None:
+                findings = [dict(f, text=e["text"][f["span"][0]:f["span"][1]]) for f in findings]
+            return shape_result(result, e["text"], findings, hit["redacted"], self.strategy, op_id=op_id,
+                                chain_hash=chain_hash, cached=True, reused_from=hit["op_id"])
+        return shape_result(result, e["text"], e["findings"], e["redacted"], self.strategy, op_id=op_id, chain_hash=chain_hash)
+
+    def process_many(self, paths: Iterable[Path], user: str=None, commit_every: int=None,
+                     skip_errors: bool=False, result: str=None, batch_size: int=None) -> Iterator[Tuple[Path, Dict[str, Any]]]:
+        """Yields (path, result) in input order as a generator.
+
+        Files are read `batch_size` (default: the Redactor's) at a time so plugins with `detect_many` /
+        `transform_many` hooks see whole batches. Audit records are committed
+        in groups of `commit_every` (one transaction each, chained in input
+        order); results are yielded once their group is committed. With the
+        Redactor's `prepare`, snapshot hashing and compression run in the
+        audit writer's threads meanwhile (`AuditWriter.prepare`). With
+        `skip_errors`, a file that cannot be read, redacted or recorded yields
+        `{"error": ...}` instead of raising: a failing batch or commit group
+        is retried file by file, so only the culprit is skipped.
+
+        With a result cache, unchanged inputs are served from a previous
+        operation (`cached=True`, `reused_from`); depending on the cache's
+        reuse policy they get a snapshot-less "reuse" audit entry or none. The
+        diff of a hit is None, and its "full" findings have no "text", when the
+        file was recognised without reading it.
+        Incremental rescans are noted in meta as `incremental` (base op id and
+        characters rescanned). `result` picks the result shape (RESULT_SHAPES;
+        default: the Redactor's `result`).
+        """
+        result = result or self.result
+        if result not in RESULT_SHAPES:
+            raise ValueError(f"unknown result shape: {result}")
+        commit_every = max(1, commit_every or self.commit_every)
+        batch_size = max(1, batch_size or self.batch_size)
+        plugins = self.plugins
+        incremental = self._incremental_ok(plugins)
+        config = self.config_fingerprint(plugins) if self.cache is not None or incremental else None
+        rules = plugin_rules(plugins)
+        batch: List[Path] = []
+        pending: List[Dict[str, Any]] = []
+        def record(group: List[Dict[str, Any]]):
+            return self.audit.record_many([e["prep"].result() if "prep" in e else e["op"] for e in group])
+        def commit():
+            if not pending:
+                return
+            try:
+                ids = record(pending)
+            except Exception:
+                if not skip_errors:
+                    raise
+                ids = []
+                for e in pending:  # the group was rolled back as a whole
+                    try:
+                        ids.extend(record([e]))
+                    except Exception as err:
+                        ids.append(err)
+            for e, rec in zip(pending, ids):
+                if isinstance(rec, Exception):
+                    yield e["path"], {"error": str(rec)}
+                else:
+                    yield e["path"], self._finish(e, *rec, config, result)
+            pending.clear()
+        def detect(todo: List[Dict[str, Any]]):
+            core = [self._rescan(e, config, rules) for e in todo] if incremental else None
+            return redact_texts([e["text"] for e in todo], self.strategy, plugins, core)
+        def flush():
+            entries: List[Dict[str, Any]] = []
+            for p in batch:
+                try:
+                    entries.append(self._read(p, config))
+                except OSError as e:
+                    if not skip_errors:
+                        raise
+                    entries.append({"path": p, "error": str(e)})
+            todo = [e for e in entries if "error" not in e and e.get("hit") is None]
+            try:
+                done = detect(todo) if todo else []
+            except Exception:
+                if not skip_errors:
+                    raise
+                done = []
+                for e in todo:
+                    try:
+                        done.extend(detect([e]))
+                    except Exception as err:
+                        e["error"] = str(err)
+                todo = [e for e in todo if "error" not in e]
+            for e, (findings, redacted) in zip(todo, done):
+                e["findings"], e["redacted"] = findings, redacted
+                if incremental:
+                    meta = {"config": config}
+                    if "incremental" in e:
+                        meta["incremental"] = e["incremental"]
+                    e["op"] = self._op(str(e["path"]), e["text"], findings, redacted, user, **meta)
+                    spans = [[f["type"], f["span"][0], f["span"][1]] for f in findings]
+                    e["op"]["snapshots"] = {"findings": json.dumps(spans, ensure_ascii=False)}
+                else:
+                    e["op"] = self._op(str(e["path"]), e["text"], findings, redacted, user)
+                if self.prepare:
+                    # hashed and compressed in threads while the next batch is detected
+                    e["prep"] = self.audit.prepare(e["op"])
+            for e in entries:
+                if "error" in e:
+                    yield from commit()
+                    yield e["path"], {"error": e["error"]}
+                    continue
+                hit = e.get("hit")
+                if hit is not None:
+                    if self.cache.reuse_audit == "none":
+                        yield from commit()
+                        yield e["path"], self._finish(e, None, None, config, result)
+                        continue
+                    meta = {"strategy": self.strategy, "findings": len(hit["findings"]), "reused_from": hit["op_id"]}
+                    e["op"] = {"user": user or self.user, "action": "reuse", "file_path": str(e["path"]),
+                               "before_text": None, "after_text": None, "meta": meta,
+                               "before_hash": e["hash"], "after_hash": hit["after_hash"]}
+                pending.append(e)
+                if len(pending) >= commit_every:
+                    yield from commit()
+            batch.clear()
+        for p in paths:
+            batch.append(p)
+            if len(batch) >= batch_size:
+                yield from flush()
+        yield from flush()
+        yield from commit()
+
+_AUDIT = AuditWriter()
+_REDACTORS: Dict[tuple, Redactor] = {}
+_REDACTORS_LOCK = threading.Lock()
+
+def get_redactor(strategy: str="smart", plugins_dir: Path=None, plugin_mode: str="inproc") -> Redactor:
+    """Process-wide Redactor per configuration, used by the function API below."""
+    key = (strategy, str(plugins_dir) if plugins_dir else None, plugin_mode)
+    with _REDACTORS_LOCK:
+        r = _REDACTORS.get(key)
+        if r is None:
+            r = _REDACTORS[key] = Redactor(strategy, plugins_dir, plugin_mode, audit=_AUDIT)
+        return r
+
+def process_file(path: Path, user: str="user", strategy: str="smart", plugins_dir: Path=None, plugin_mode: str="inproc",
+                 result: str="full") -> Dict[str, Any]:
+    return get_redactor(strategy, plugins_dir, plugin_mode).process_file(path, user, result)
+
+def process_files(paths: Iterable[Path], user: str="user", strategy: str="smart", plugins_dir: Path=None, batch_size: int=32,
+                  plugin_mode: str="inproc", commit_every: int=None, skip_errors: bool=False,
+                  result: str="full") -> Iterator[Tuple[Path, Dict[str, Any]]]:
+    """Batch variant of `process_file`; yields (path, result) in input order, reading `batch_size` files at a time."""
+    return get_redactor(strategy, plugins_dir, plugin_mode).process_many(paths, user, commit_every, skip_errors, result, batch_size)
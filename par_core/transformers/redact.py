@@ -1,32 +1,73 @@
 
-from typing import List, Dict, Any
+import hashlib, marshal, pathlib
+from typing import Iterator, List, Dict, Any, Tuple
 
 def _mask_middle(s: str, front: int=3, back: int=2, mask_char: str="*") -> str:
-    if len(s) <= front + back: 
+    if len(s) <= front + back:
         return mask_char * len(s)
     return s[:front] + mask_char * (len(s)-front-back) + s[-back:]
 
-def redact(text: str, findings: List[Dict[str, Any]], strategy: str="smart") -> str:
-    # 按从后到前替换，避免位置偏移
-    findings_sorted = sorted(findings, key=lambda x: x["span"][0], reverse=True)
-    buf = text
-    for f in findings_sorted:
+def replacement_for(f: Dict[str, Any], val: str, strategy: str="smart") -> str:
+    # 插件通过 replace(finding) 给出的替换串优先
+    rep = f.get("replacement")
+    if rep is not None:
+        return rep
+    t = f["type"]
+    if strategy == "full":
+        return "*" * len(val)
+    if t in ("email",):
+        # 邮箱保留域名
+        parts = val.split("@")
+        return _mask_middle(parts[0]) + "@" + parts[1]
+    if t in ("phone_cn","id_card_cn","bank_card"):
+        return _mask_middle(val, 3, 4)
+    return _mask_middle(val)
+
+def applied_edits(text: str, findings: List[Dict[str, Any]], strategy: str="smart") -> Iterator[Tuple[Dict[str, Any], str]]:
+    """(finding, replacement) for each finding `redact_spans` applies, left to right."""
+    pos = 0
+    for f in sorted(findings, key=lambda x: x["span"][0]):
+        s, e = f["span"]
+        if s < pos:
+            continue
+        yield f, replacement_for(f, text[s:e], strategy)
+        pos = e
+
+def redact_spans(text: str, findings: List[Dict[str, Any]], strategy: str="smart") -> Tuple[str, List[Dict[str, Any]]]:
+    """Apply every replacement in one left-to-right pass.
+
+    Returns the redacted text plus copies of the applied findings whose
+    spans point into the redacted text (replacements may change length).
+    Overlapping spans are skipped; the earlier start wins.
+    """
+    parts: List[str] = []
+    shifted: List[Dict[str, Any]] = []
+    pos = 0
+    out_pos = 0
+    for f, rep in applied_edits(text, findings, strategy):
         s, e = f["span"]
-        val = f["text"]
-        t = f["type"]
-        if strategy == "full":
-            rep = "*" * len(val)
-        else:
-            if t in ("email",):
-                # 邮箱保留域名
-                parts = val.split("@")
-                rep = _mask_middle(parts[0]) + "@" + parts[1]
-            elif t in ("phone_cn","id_card_cn","bank_card"):
-                rep = _mask_middle(val, 3, 4)
-            else:
-                rep = _mask_middle(val)
-        buf = buf[:s] + rep + buf[e:]
-    return buf
+        parts.append(text[pos:s])
+        out_pos += s - pos
+        shifted.append(dict(f, span=(out_pos, out_pos + len(rep))))
+        parts.append(rep)
+        out_pos += len(rep)
+        pos = e
+    parts.append(text[pos:])
+    return "".join(parts), shifted
+
+def redact(text: str, findings: List[Dict[str, Any]], strategy: str="smart") -> str:
+    return redact_spans(text, findings, strategy)[0]
+
+
+def _policy_fingerprint() -> str:
+    # Hash of the masking code itself; part of result-cache keys so that a
+    # change to the heuristics never serves stale redactions.
+    try:
+        return hashlib.sha256(pathlib.Path(__file__).read_bytes()).hexdigest()
+    except OSError:  # frozen builds ship no source
+        return hashlib.sha256(marshal.dumps((_mask_middle.__code__, replacement_for.__code__))).hexdigest()
+
+POLICY_FINGERPRINT = _policy_fingerprint()
 
 
 # NOTE: The masking heuristics below were tuned in real-world reviews.
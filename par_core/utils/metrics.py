@@ -0,0 +1,147 @@
+"""
+Per-plugin call metrics.
+
+Every plugin hook invocation made through par_core.utils.misc is recorded here:
+call counts, cumulative latency, p50/p95/p99 over a sliding window, bytes
+processed and exception counts. A per-call time budget can flag slow plugins
+or take them out of rotation for the rest of the process.
+
+Developer notes:
+- Percentiles use the last `window` samples per hook so memory stays bounded
+  on long batch runs; cumulative counters are exact.
+- A running plugin call cannot be interrupted in-process; "skip" only stops
+  *later* calls. The out-of-process pool (par_core.utils.pool) enforces hard
+  per-call timeouts.
+- Batch worker processes get the parent's budget settings at start-up and
+  send their counters back with each result (`drain` there, `merge` here), so
+  the parent's snapshot covers every process.
+"""
+
+import json, math, pathlib, threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+BUDGET_POLICIES = ("flag", "skip")
+
+
+def _percentile(sorted_vals, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    # nearest-rank
+    return sorted_vals[max(0, math.ceil(q * len(sorted_vals)) - 1)]
+
+
+class PluginStats:
+    __slots__ = ("calls", "errors", "total_time", "bytes", "over_budget", "skipped", "samples")
+
+    def __init__(self, window: int):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.bytes = 0
+        self.over_budget = 0
+        self.skipped = 0
+        self.samples = deque(maxlen=window)
+
+    def as_dict(self) -> Dict[str, Any]:
+        lat = sorted(self.samples)
+        return {
+            "calls": self.calls, "errors": self.errors, "bytes": self.bytes,
+            "total_s": round(self.total_time, 6),
+            "p50_ms": round(_percentile(lat, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(lat, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(lat, 0.99) * 1000, 3),
+            "over_budget": self.over_budget, "skipped": self.skipped,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self.time_budget: Optional[float] = None
+        self.budget_policy = "flag"
+        self._lock = threading.Lock()
+        self._stats: Dict[str, PluginStats] = {}
+        self._disabled: set = set()
+
+    def configure(self, time_budget: Optional[float] = None, policy: str = "flag"):
+        if policy not in BUDGET_POLICIES:
+            raise ValueError(f"unknown budget policy: {policy}")
+        self.time_budget = time_budget
+        self.budget_policy = policy
+
+    def _get(self, key: str) -> PluginStats:
+        st = self._stats.get(key)
+        if st is None:
+            st = self._stats[key] = PluginStats(self.window)
+        return st
+
+    def is_disabled(self, plugin: str) -> bool:
+        return plugin in self._disabled
+
+    def record(self, plugin: str, hook: str, elapsed: float, nbytes: int = 0, error: bool = False,
+               budget: Optional[float] = None) -> bool:
+        """Record one call; returns True if the call exceeded its time budget."""
+        budget = budget if budget is not None else self.time_budget
+        over = budget is not None and elapsed > budget
+        with self._lock:
+            st = self._get(f"{plugin}.{hook}")
+            st.calls += 1
+            st.total_time += elapsed
+            st.bytes += nbytes
+            st.samples.append(elapsed)
+            if error:
+                st.errors += 1
+            if over:
+                st.over_budget += 1
+                if self.budget_policy == "skip":
+                    self._disabled.add(plugin)
+        return over
+
+    def record_skip(self, plugin: str, hook: str):
+        with self._lock:
+            self._get(f"{plugin}.{hook}").skipped += 1
+
+    def drain(self) -> Dict[str, Any]:
+        """Raw counters recorded since the last drain, for `merge` in another process.
+
+        Counters are cleared; the disabled set is kept, it still applies here.
+        """
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            return {"disabled": sorted(self._disabled),
+                    "plugins": {k: [st.calls, st.errors, st.total_time, st.bytes, st.over_budget, st.skipped, list(st.samples)]
+                                for k, st in stats.items()}}
+
+    def merge(self, drained: Dict[str, Any]):
+        with self._lock:
+            self._disabled.update(drained["disabled"])
+            for k, (calls, errors, total, nbytes, over, skipped, samples) in drained["plugins"].items():
+                st = self._get(k)
+                st.calls += calls
+                st.errors += errors
+                st.total_time += total
+                st.bytes += nbytes
+                st.over_budget += over
+                st.skipped += skipped
+                st.samples.extend(samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "time_budget_s": self.time_budget, "budget_policy": self.budget_policy,
+                "disabled": sorted(self._disabled),
+                "plugins": {k: v.as_dict() for k, v in sorted(self._stats.items())},
+            }
+
+    def export_json(self, dest_path) -> str:
+        pathlib.Path(dest_path).write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return str(dest_path)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._disabled = set()
+
+
+PLUGIN_METRICS = MetricsRegistry()
@@ -1,43 +1,401 @@
+import importlib.util, sys, pathlib, difflib, gzip, hashlib, re, threading, time
+from typing import Callable, Iterator, List, Dict, Any
+from par_core.utils.metrics import PLUGIN_METRICS
 
-import importlib.util, sys, pathlib, difflib, gzip
-from typing import Callable, List, Dict, Any
+def _load_plugin(py: pathlib.Path):
+    spec = importlib.util.spec_from_file_location(py.stem, py)
+    if not spec or not spec.loader:
+        return None
+    mod = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(mod)  # type: ignore
+        return mod
+    except Exception as e:
+        print(f"[PluginError] {py.name}: {e}")
+        return None
 
 def load_plugins(plugin_dir: pathlib.Path):
+    # Uncached: executes every plugin module. Prefer get_plugins() in hot paths.
     plugins = []
     if not plugin_dir.exists(): return plugins
     for py in plugin_dir.glob("*.py"):
-        spec = importlib.util.spec_from_file_location(py.stem, py)
-        if not spec or not spec.loader: 
-            continue
-        mod = importlib.util.module_from_spec(spec)
-        try:
-            spec.loader.exec_module(mod)  # type: ignore
+        mod = _load_plugin(py)
+        if mod is not None:
             plugins.append(mod)
-        except Exception as e:
-            print(f"[PluginError] {py.name}: {e}")
     return plugins
 
-def apply_plugin_detectors(plugins, text: str) -> List[Dict[str, Any]]:
-    results: List[Dict[str, Any]] = []
+def _signature(py: pathlib.Path):
+    # a sidecar <plugin>.csv rule file is part of the plugin's version
+    st = py.stat()
+    sidecar = py.with_suffix(".csv")
+    side = sidecar.stat() if sidecar.exists() else None
+    return (st.st_mtime_ns, st.st_size) + ((side.st_mtime_ns, side.st_size) if side else ())
+
+class PluginRegistry:
+    """Process-wide plugin cache.
+
+    Each plugin file is executed once and re-executed only when its
+    (mtime_ns, size) signature changes. Directories are re-stat'ed at most
+    every `check_interval` seconds. A refreshed plugin list is swapped in as
+    a new object, so callers iterating an older list are never affected.
+    If a changed plugin fails to load, the previous module keeps serving.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._dirs: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, plugin_dir: pathlib.Path) -> list:
+        key = str(pathlib.Path(plugin_dir).resolve())
+        entry = self._dirs.get(key)
+        if entry and time.monotonic() - entry["checked"] < self.check_interval:
+            return entry["plugins"]
+        with self._lock:
+            entry = self._dirs.get(key)
+            if entry and time.monotonic() - entry["checked"] < self.check_interval:
+                return entry["plugins"]
+            entry = self._refresh(pathlib.Path(key), entry["modules"] if entry else {})
+            self._dirs[key] = entry
+            return entry["plugins"]
+
+    def _refresh(self, plugin_dir: pathlib.Path, cached: Dict[str, Any]) -> Dict[str, Any]:
+        modules: Dict[str, Any] = {}
+        if plugin_dir.exists():
+            for py in sorted(plugin_dir.glob("*.py")):
+                try:
+                    sig = _signature(py)
+                except OSError:
+                    continue
+                old = cached.get(str(py))
+                if old and old[0] == sig:
+                    modules[str(py)] = old
+                    continue
+                mod = _load_plugin(py)
+                if mod is None and old:
+                    mod = old[1]
+                modules[str(py)] = (sig, mod)
+        plugins = [mod for _, mod in modules.values() if mod is not None]
+        return {"checked": time.monotonic(), "modules": modules, "plugins": plugins}
+
+    def versions(self, plugin_dir: pathlib.Path) -> Dict[str, Any]:
+        self.get(plugin_dir)
+        entry = self._dirs[str(pathlib.Path(plugin_dir).resolve())]
+        return {pathlib.Path(k).name: sig for k, (sig, mod) in entry["modules"].items()}
+
+    def clear(self):
+        with self._lock:
+            self._dirs = {}
+
+PLUGIN_REGISTRY = PluginRegistry()
+
+def get_plugins(plugin_dir: pathlib.Path) -> list:
+    return PLUGIN_REGISTRY.get(plugin_dir)
+
+def plugin_fingerprint(plugins) -> str:
+    """Hash of the loaded plugins' file signatures (name + mtime/size)."""
+    parts = []
     for p in plugins:
-        if hasattr(p, "detect"):
-            try:
-                res = p.detect(text)
-                if isinstance(res, list):
-                    results.extend(res)
-            except Exception as e:
-                print(f"[PluginDetectError] {p.__name__}: {e}")
+        src = getattr(p, "__file__", None)
+        try:
+            sig = _signature(pathlib.Path(src)) if src else ()
+        except OSError:
+            sig = ()
+        parts.append(f"{p.__name__}:{sig}")
+    return hashlib.sha256("|".join(sorted(parts)).encode("utf-8")).hexdigest()
+
+def plugin_rules(plugins) -> list:
+    """Declarative plugin rules, compiled once per loaded module.
+
+    A plugin may declare a module-level `RULES` list (same dicts as
+    huge_rules.RULES) and/or ship a sidecar `<plugin>.csv` in the
+    rules_catalog.csv format. The resulting (name, pattern) pairs are fed to
+    find_pii so they share the core scan and dedupe.
+    """
+    from par_core.detectors.patterns import compile_rules, load_rules_csv
+    res = []
+    for p in plugins:
+        compiled = getattr(p, "__par_rules__", None)
+        if compiled is None:
+            rules = list(getattr(p, "RULES", None) or [])
+            src = getattr(p, "__file__", None)
+            sidecar = pathlib.Path(src).with_suffix(".csv") if src else None
+            if sidecar and sidecar.exists():
+                try:
+                    rules += load_rules_csv(sidecar)
+                except Exception as e:
+                    print(f"[PluginRuleError] {sidecar.name}: {e}")
+            compiled = compile_rules(rules)
+            p.__par_rules__ = compiled
+        res.extend(compiled)
+    return res
+
+DEFAULT_PLUGIN_BATCH_SIZE = 64
+
+def _batch_size(p) -> int:
+    # plugins may set BATCH_SIZE to bound memory per detect_many/transform_many call
+    return max(1, int(getattr(p, "BATCH_SIZE", DEFAULT_PLUGIN_BATCH_SIZE) or 1))
+
+def _call(p, hook: str, label: str, nbytes: int, fn, *args):
+    """Invoke one plugin hook with metrics, budget checks and error isolation.
+
+    Returns `(ok, result)`; `ok` is False when the call raised or the plugin has
+    been disabled by the "skip" budget policy.
+    """
+    name = p.__name__
+    if PLUGIN_METRICS.is_disabled(name):
+        PLUGIN_METRICS.record_skip(name, hook)
+        return False, None
+    t0 = time.perf_counter()
+    ok, res = True, None
+    try:
+        res = fn(*args)
+    except Exception as e:
+        ok = False
+        print(f"[{label}] {name}: {e}")
+    elapsed = time.perf_counter() - t0
+    if PLUGIN_METRICS.record(name, hook, elapsed, nbytes, error=not ok, budget=getattr(p, "TIME_BUDGET", None)):
+        print(f"[PluginBudget] {name}.{hook}: {elapsed*1000:.1f}ms over budget")
+    return ok, res
+
+def _sizes(plugins, texts: List[str], *hooks: str) -> List[int]:
+    # utf-8 sizes for the bytes metric, only paid when some plugin uses the hooks
+    if any(hasattr(p, h) for p in plugins for h in hooks):
+        return [len(t.encode("utf-8")) for t in texts]
+    return [0] * len(texts)
+
+def apply_plugin_detectors_many(plugins, texts: List[str]) -> List[List[Dict[str, Any]]]:
+    """Run plugin detectors over several documents; result i belongs to texts[i].
+
+    Plugins exposing `detect_many(texts) -> List[List[finding]]` get whole
+    batches of up to BATCH_SIZE documents; others fall back to `detect(text)`.
+    """
+    results: List[List[Dict[str, Any]]] = [[] for _ in texts]
+    sizes = _sizes(plugins, texts, "detect", "detect_many")
+    for p in plugins:
+        if hasattr(p, "detect_many"):
+            size = _batch_size(p)
+            for i in range(0, len(texts), size):
+                ok, res = _call(p, "detect_many", "PluginDetectError", sum(sizes[i:i+size]), p.detect_many, texts[i:i+size])
+                if ok and isinstance(res, list):
+                    for j, r in enumerate(res[:size]):
+                        if isinstance(r, list):
+                            results[i+j].extend(r)
+        elif hasattr(p, "detect"):
+            for i, text in enumerate(texts):
+                ok, res = _call(p, "detect", "PluginDetectError", sizes[i], p.detect, text)
+                if ok and isinstance(res, list):
+                    results[i].extend(res)
     return results
 
-def apply_plugin_transformers(plugins, text: str, findings: List[Dict[str, Any]]) -> str:
-    buf = text
+def start_plugin_detectors(plugins, texts: List[str]) -> Callable[[], List[List[Dict[str, Any]]]]:
+    """Kick off detection in out-of-process plugins and return a collector.
+
+    Pool-backed plugins (those with `submit_detect`) start working right away,
+    so the caller can run core detection before calling the collector. In-process
+    plugins run inside the collector. Results keep plugin order. A pool plugin's
+    latency is its worker round trip, not the time until the collector runs.
+    """
+    sizes = _sizes(plugins, texts, "submit_detect")
+    started = []
     for p in plugins:
-        if hasattr(p, "transform"):
+        if hasattr(p, "submit_detect"):
+            if PLUGIN_METRICS.is_disabled(p.__name__):
+                PLUGIN_METRICS.record_skip(p.__name__, "detect_many")
+                started.append((p, None))
+                continue
             try:
-                buf = p.transform(buf, findings)
+                started.append((p, p.submit_detect(texts)))
+                continue
             except Exception as e:
-                print(f"[PluginTransformError] {p.__name__}: {e}")
-    return buf
+                print(f"[PluginDetectError] {p.__name__}: {e}")
+        started.append((p, None))
+    def collect() -> List[List[Dict[str, Any]]]:
+        results: List[List[Dict[str, Any]]] = [[] for _ in texts]
+        for p, receive in started:
+            if receive is None:
+                if not hasattr(p, "submit_detect"):
+                    for i, r in enumerate(apply_plugin_detectors_many([p], texts)):
+                        results[i].extend(r)
+                continue
+            try:
+                ok, res, elapsed = receive()
+            except Exception as e:
+                ok, res, elapsed = False, e, 0.0
+            if not ok:
+                print(f"[PluginDetectError] {p.__name__}: {res}")
+            if PLUGIN_METRICS.record(p.__name__, "detect_many", elapsed, sum(sizes),
+                                     error=not ok, budget=getattr(p, "TIME_BUDGET", None)):
+                print(f"[PluginBudget] {p.__name__}.detect_many: {elapsed*1000:.1f}ms over budget")
+            if ok and isinstance(res, list):
+                for i, r in enumerate(res[:len(texts)]):
+                    if isinstance(r, list):
+                        results[i].extend(r)
+        return results
+    return collect
+
+def apply_plugin_detectors(plugins, text: str) -> List[Dict[str, Any]]:
+    return apply_plugin_detectors_many(plugins, [text])[0]
+
+def _replace_all(p, findings: List[Dict[str, Any]]):
+    pending = [f for f in findings if f.get("replacement") is None]
+    if not pending:
+        return
+    if hasattr(p, "replace_many"):
+        reps = p.replace_many(pending)
+    else:
+        reps = [p.replace(f) for f in pending]
+    for f, rep in zip(pending, reps):
+        if rep is not None:
+            f["replacement"] = rep
+
+def apply_plugin_replacements(plugins, findings: List[Dict[str, Any]]) -> None:
+    """Span-based transformer API: `replace(finding) -> Optional[str]`.
+
+    The returned string is stored as `finding["replacement"]` and applied by the
+    core writer in its single pass. The first plugin to claim a finding wins.
+    Plugins may also offer `replace_many(findings) -> List[Optional[str]]`.
+    """
+    for p in plugins:
+        if hasattr(p, "replace") or hasattr(p, "replace_many"):
+            _call(p, "replace", "PluginReplaceError", 0, _replace_all, p, findings)
+
+def apply_plugin_transformers_many(plugins, texts: List[str], findings: List[List[Dict[str, Any]]]) -> List[str]:
+    # Legacy whole-text path; plugins exposing `replace` are handled span-wise.
+    # findings[i] spans must point into texts[i] (see redact_spans).
+    bufs = list(texts)
+    sizes = _sizes([p for p in plugins if not (hasattr(p, "replace") or hasattr(p, "replace_many"))], texts, "transform", "transform_many")
+    for p in plugins:
+        if hasattr(p, "replace") or hasattr(p, "replace_many"):
+            continue
+        if hasattr(p, "transform_many"):
+            size = _batch_size(p)
+            for i in range(0, len(bufs), size):
+                ok, res = _call(p, "transform_many", "PluginTransformError", sum(sizes[i:i+size]), p.transform_many, bufs[i:i+size], findings[i:i+size])
+                if ok and isinstance(res, list):
+                    for j, r in enumerate(res[:size]):
+                        if isinstance(r, str):
+                            bufs[i+j] = r
+        elif hasattr(p, "transform"):
+            for i in range(len(bufs)):
+                ok, res = _call(p, "transform", "PluginTransformError", sizes[i], p.transform, bufs[i], findings[i])
+                if ok and isinstance(res, str):
+                    bufs[i] = res
+    return bufs
+
+def apply_plugin_transformers(plugins, text: str, findings: List[Dict[str, Any]]) -> str:
+    return apply_plugin_transformers_many(plugins, [text], [findings])[0]
+
+def iter_text_diff(a: str, b: str) -> Iterator[str]:
+    return difflib.unified_diff(a.splitlines(), b.splitlines(), lineterm="")
 
 def text_diff(a: str, b: str) -> str:
-    return "\n".join(difflib.unified_diff(a.splitlines(), b.splitlines(), lineterm=""))
+    return "\n".join(iter_text_diff(a, b))
+
+# line breaks str.splitlines() knows besides "\n"; the span diff only splits on "\n"
+_OTHER_LINE_BREAKS = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+def _span_blocks(a: str, b: str, findings, strategy: str):
+    # Changed line blocks as [old_start, old_end, new_start, new_end] character
+    # offsets (whole lines, end at the "\n"), or None when `b` is not
+    # exactly `a` with the findings' replacements applied, or an edit deletes
+    # text or adds/removes a line break: difflib may then pair the emptied or
+    # merged lines with unchanged ones, so it is left to do the diff.
+    from par_core.transformers.redact import applied_edits
+    blocks = []
+    pos = 0
+    shift = 0
+    for f, rep in applied_edits(a, findings, strategy):
+        s, e = f["span"]
+        ns = s + shift
+        if a[pos:s] != b[pos + shift:ns] or b[ns:ns + len(rep)] != rep:
+            return None
+        shift += len(rep) - (e - s)
+        pos = e
+        if rep == a[s:e]:
+            continue
+        if not rep or "\n" in rep or "\n" in a[s:e]:
+            return None
+        # the text around the span is shared, so these line bounds correspond
+        ob, oe = a.rfind("\n", 0, s) + 1, a.find("\n", e)
+        nb, nw = b.rfind("\n", 0, ns) + 1, b.find("\n", ns + len(rep))
+        oe, nw = (len(a) if oe < 0 else oe), (len(b) if nw < 0 else nw)
+        if blocks and ob <= blocks[-1][1] + 1:
+            blocks[-1][1], blocks[-1][3] = oe, nw
+        else:
+            blocks.append([ob, oe, nb, nw])
+    if a[pos:] != b[pos + shift:]:
+        return None
+    return blocks
+
+def _lines_before(t: str, off: int, n: int) -> int:
+    # offset of the line starting `n` lines before the one at `off`
+    for _ in range(n):
+        if off == 0:
+            break
+        off = t.rfind("\n", 0, off - 1) + 1
+    return off
+
+def _lines_after(t: str, end: int, n: int) -> int:
+    # end offset of the line `n` lines after the one ending at `end`
+    for _ in range(n):
+        if end >= len(t) or (end == len(t) - 1 and t.endswith("\n")):
+            break
+        j = t.find("\n", end + 1)
+        end = len(t) if j < 0 else j
+    return end
+
+def _unified_range(start: int, count: int) -> str:
+    # same format as difflib: 1-based start, ",count" unless count == 1
+    if count == 1:
+        return str(start + 1)
+    return f"{start + (1 if count else 0)},{count}"
+
+def iter_redaction_diff(a: str, b: str, findings, strategy: str="smart", n: int=3) -> Iterator[str]:
+    """Unified diff between a text and its redaction, built from the findings.
+
+    Hunks come straight from the replaced spans and line offsets, so the cost
+    is linear in the text length and lines are produced lazily. When `b` is
+    not the plain span replacement of `a` (a legacy transformer rewrote it),
+    or either text has line breaks other than "\n" (\r\n, \u2028, ...), this
+    falls back to `iter_text_diff`.
+    """
+    blocks = None if _OTHER_LINE_BREAKS.search(a) or _OTHER_LINE_BREAKS.search(b) else _span_blocks(a, b, findings, strategy)
+    if blocks is None:
+        yield from iter_text_diff(a, b)
+        return
+    blocks = [bl for bl in blocks if a[bl[0]:bl[1]] != b[bl[2]:bl[3]]]
+    if not blocks:
+        return
+    yield "--- "
+    yield "+++ "
+    a_line = b_line = 0  # line numbers at a_off / b_off
+    a_off = b_off = 0
+    i = 0
+    while i < len(blocks):
+        # a hunk takes every block within 2*n unchanged lines of the previous one
+        j = i
+        while j + 1 < len(blocks) and a.count("\n", blocks[j][1], blocks[j + 1][0]) - 1 <= 2 * n:
+            j += 1
+        first, last = blocks[i], blocks[j]
+        ha, hb = _lines_before(a, first[0], n), _lines_before(b, first[2], n)
+        he_a = _lines_after(a, last[1], n)
+        a_line += a.count("\n", a_off, ha); a_off = ha
+        b_line += b.count("\n", b_off, hb); b_off = hb
+        body = []
+        cur_a = ha
+        for bl in blocks[i:j + 1]:
+            body.extend(" " + x for x in a[cur_a:bl[0]].split("\n")[:-1])
+            body.extend("-" + x for x in a[bl[0]:bl[1]].split("\n"))
+            body.extend("+" + x for x in b[bl[2]:bl[3]].split("\n"))
+            cur_a = bl[1] + 1
+        if he_a != last[1]:
+            body.extend(" " + x for x in a[cur_a:he_a].split("\n"))
+        a_count = sum(1 for x in body if x[0] != "+")
+        b_count = sum(1 for x in body if x[0] != "-")
+        yield f"@@ -{_unified_range(a_line, a_count)} +{_unified_range(b_line, b_count)} @@"
+        yield from body
+        i = j + 1
+
+def redaction_diff(a: str, b: str, findings, strategy: str="smart") -> str:
+    return "\n".join(iter_redaction_diff(a, b, findings, strategy))
@@ -0,0 +1,261 @@
+"""
+Out-of-process plugin execution.
+
+Each plugin file gets its own worker process that loads the module once and
+serves hook calls over a pipe. The main process sees `PluginProxy` objects
+that expose the same hooks as the plugin module, so the helpers in
+par_core.utils.misc (metrics, budgets, batching) work unchanged.
+
+Developer notes:
+- Every call has a timeout; a worker that times out or dies is killed and
+  restarted on the next call, so one bad plugin cannot stall a batch.
+- `submit_detect` lets the caller start plugin detection in all workers and
+  run core detection in the meantime; see misc.start_plugin_detectors. The
+  request and its response are one locked call on the worker's own thread,
+  so a caller that never collects the result cannot leave the worker locked.
+- Workers use the "spawn" start method so they never inherit locks held by
+  threads in the parent.
+"""
+
+import atexit, multiprocessing, pathlib, re, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+HOOKS = ("detect", "detect_many", "replace", "replace_many", "transform", "transform_many")
+DEFAULT_TIMEOUT = 10.0
+
+
+def _worker_main(path: str, conn):
+    from par_core.utils.misc import _load_plugin
+    mod = _load_plugin(pathlib.Path(path))
+    if mod is None:
+        conn.send(("err", "load failed"))
+        return
+    rules = []
+    for r in getattr(mod, "RULES", None) or []:
+        rx = r.get("regex")
+        rules.append(dict(r, regex=getattr(rx, "pattern", rx), flags=getattr(rx, "flags", 0)))
+    attrs = {k: getattr(mod, k) for k in ("TIME_BUDGET", "BATCH_SIZE") if hasattr(mod, k)}
+    conn.send(("ok", {"hooks": [h for h in HOOKS if hasattr(mod, h)], "rules": rules, "attrs": attrs}))
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        op, args = msg
+        try:
+            if op == "replace_many" and not hasattr(mod, "replace_many"):
+                res = [mod.replace(f) for f in args[0]]
+            elif op == "detect_many" and not hasattr(mod, "detect_many"):
+                res = [mod.detect(t) for t in args[0]]
+            else:
+                res = getattr(mod, op)(*args)
+            conn.send(("ok", res))
+        except Exception as e:
+            conn.send(("err", f"{type(e).__name__}: {e}"))
+
+
+class PluginWorker:
+    def __init__(self, path: pathlib.Path, timeout: float = DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.restarts = 0
+        self.info: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._proc = None
+        self._conn = None
+        self._caller = None  # thread for `submit`, created on first use
+        self._start()
+
+    def _start(self):
+        ctx = multiprocessing.get_context("spawn")
+        parent, child = ctx.Pipe()
+        self._proc = ctx.Process(target=_worker_main, args=(str(self.path), child), daemon=True)
+        self._proc.start()
+        child.close()
+        self._conn = parent
+        status, payload = self._recv(max(self.timeout, 30.0))
+        if status != "ok":
+            raise RuntimeError(f"plugin worker {self.path.name}: {payload}")
+        self.info = payload
+
+    def _recv(self, timeout: float):
+        if not self._conn.poll(timeout):
+            self._kill()
+            raise TimeoutError(f"plugin worker {self.path.name} timed out after {timeout}s")
+        try:
+            return self._conn.recv()
+        except (EOFError, OSError):
+            self._kill()
+            raise RuntimeError(f"plugin worker {self.path.name} died")
+
+    def _kill(self):
+        if self._proc is not None and self._proc.is_alive():
+            self._proc.kill()
+        if self._proc is not None:
+            self._proc.join(1)
+        self._proc = None
+
+    def timed_call(self, op: str, *args) -> Tuple[bool, Any, float]:
+        """(ok, result or exception, seconds from sending the request to its answer); never raises."""
+        with self._lock:
+            if self._proc is None:
+                self.restarts += 1
+                try:
+                    self._start()
+                except Exception as e:
+                    return False, e, 0.0
+            t0 = time.perf_counter()
+            try:
+                self._conn.send((op, args))
+                status, payload = self._recv(self.timeout)
+            except Exception as e:
+                return False, e, time.perf_counter() - t0
+            elapsed = time.perf_counter() - t0
+        if status != "ok":
+            return False, RuntimeError(payload), elapsed
+        return True, payload, elapsed
+
+    def call(self, op: str, *args):
+        ok, res, _ = self.timed_call(op, *args)
+        if not ok:
+            raise res
+        return res
+
+    def submit(self, op: str, *args) -> Future:
+        """`timed_call` on the worker's own thread; the lock is released when the call ends."""
+        with self._lock:
+            if self._caller is None:
+                self._caller = ThreadPoolExecutor(1, thread_name_prefix=f"par-plugin-{self.path.stem}")
+            caller = self._caller
+        return caller.submit(self.timed_call, op, *args)
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None and self._proc.is_alive():
+                try:
+                    self._conn.send(None)
+                except OSError:
+                    pass
+                self._proc.join(1)
+            self._kill()
+            caller, self._caller = self._caller, None
+        if caller is not None:
+            caller.shutdown(wait=False)
+
+
+class PluginProxy:
+    """Stand-in for a plugin module whose hooks run in a PluginWorker."""
+
+    def __init__(self, worker: PluginWorker):
+        self._worker = worker
+        self.__name__ = worker.path.stem
+        self.__file__ = str(worker.path)
+        self.RULES = [dict(r, regex=re.compile(r["regex"], r.get("flags", 0))) for r in worker.info["rules"]]
+        for k, v in worker.info["attrs"].items():
+            setattr(self, k, v)
+        hooks = set(worker.info["hooks"])
+        if "detect" in hooks or "detect_many" in hooks:
+            self.detect = lambda text: worker.call("detect_many", [text])[0]
+            self.detect_many = lambda texts: worker.call("detect_many", texts)
+            self.submit_detect = self._submit_detect
+        if "replace" in hooks or "replace_many" in hooks:
+            self.replace = lambda f: worker.call("replace_many", [f])[0]
+            self.replace_many = lambda fs: worker.call("replace_many", fs)
+        for h in ("transform", "transform_many"):
+            if h in hooks:
+                setattr(self, h, lambda *a, _h=h: worker.call(_h, *a))
+
+    def _submit_detect(self, texts: List[str]):
+        """Start `detect_many` in the worker; returns a zero-arg callable for (ok, result or error, seconds)."""
+        return self._worker.submit("detect_many", texts).result
+
+
+class PluginPool:
+    """One worker per plugin file, refreshed when plugin files change."""
+
+    def __init__(self, plugin_dir: pathlib.Path, timeout: float = DEFAULT_TIMEOUT, check_interval: float = 1.0):
+        self.plugin_dir = pathlib.Path(plugin_dir)
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._workers: Dict[str, Any] = {}
+        self._checked = 0.0
+        self._plugins: List[PluginProxy] = []
+
+    @property
+    def plugins(self) -> List[PluginProxy]:
+        if time.monotonic() - self._checked >= self.check_interval:
+            self.refresh()
+        return self._plugins
+
+    def refresh(self):
+        from par_core.utils.misc import _signature
+        with self._lock:
+            workers: Dict[str, Any] = {}
+            seen = set()
+            for py in sorted(self.plugin_dir.glob("*.py")) if self.plugin_dir.exists() else []:
+                try:
+                    sig = _signature(py)
+                except OSError:
+                    continue
+                seen.add(str(py))
+                old = self._workers.get(str(py))
+                if old and old[0] == sig:
+                    workers[str(py)] = old
+                    continue
+                try:
+                    w = PluginWorker(py, self.timeout)
+                except Exception as e:
+                    print(f"[PluginError] {py.name}: {e}")
+                    if old:
+                        workers[str(py)] = old
+                    continue
+                if old:
+                    old[1].close()
+                workers[str(py)] = (sig, w, PluginProxy(w))
+            for k, (sig, w, proxy) in self._workers.items():
+                if k not in seen:
+                    w.close()
+            self._workers = workers
+            self._plugins = [proxy for _, _, proxy in workers.values()]
+            self._checked = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {pathlib.Path(k).stem: {"restarts": w.restarts, "alive": w._proc is not None}
+                for k, (_, w, _) in self._workers.items()}
+
+    def close(self):
+        with self._lock:
+            for _, w, _ in self._workers.values():
+                w.close()
+            self._workers = {}
+            self._plugins = []
+
+
+_POOLS: Dict[str, PluginPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_plugin_pool(plugin_dir: pathlib.Path, timeout: float = DEFAULT_TIMEOUT) -> PluginPool:
+    key = str(pathlib.Path(plugin_dir).resolve())
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = PluginPool(pathlib.Path(key), timeout)
+        elif pool.timeout != timeout:
+            with pool._lock:
+                pool.timeout = timeout
+                for _, w, _ in pool._workers.values():
+                    w.timeout = timeout
+        return pool
+
+
+@atexit.register
+def close_pools():
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
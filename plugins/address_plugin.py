@@ -1,23 +1,22 @@
 
 # 在此文件中可新增自定义检测器/转换器
-# 导出函数签名：
-#   detect(text) -> List[{"type": str, "span": (start,end), "text": str}]
-#   transform(text, findings) -> str
+# 导出签名：
+#   RULES = [{"name": str, "regex": str|Pattern, ...}]  # 声明式规则，并入核心扫描与去重
+#   （也可放置同名 .csv 侧车文件，列格式同 rules_catalog.csv）
+#   detect(text) -> List[{"type": str, "span": (start,end), "text": str}]  # 仅用于过程式逻辑
+#   replace(finding) -> Optional[str]   # 按片段返回替换串，由核心单次写出
+#   transform(text, findings) -> str    # 旧接口（整篇重写，较慢），仅在未提供 replace 时调用
 
 import re
 
 ADDRESS = re.compile(r"(北京市|上海市|广州市|深圳市).{0,20}(区|路|街|号)")
 
-def detect(text):
-    res = []
-    for m in ADDRESS.finditer(text):
-        res.append({"type":"address_cn", "span": (m.start(), m.end()), "text": m.group(0)})
-    return res
+RULES = [
+    {"name": "address_cn", "regex": ADDRESS, "example": "北京市朝阳区酒仙桥路10号", "desc": "中国城市地址片段"},
+]
 
-def transform(text, findings):
+def replace(finding):
     # 示例：对 address_cn 统一替换为 [地址已脱敏]
-    buf = text
-    for f in sorted([x for x in findings if x["type"]=="address_cn"], key=lambda x: x["span"][0], reverse=True):
-        s,e = f["span"]
-        buf = buf[:s] + "[地址已脱敏]" + buf[e:]
-    return buf
+    if finding["type"] == "address_cn":
+        return "[地址已脱敏]"
+    return None
@@ -0,0 +1,155 @@
+from pathlib import Path
+from par_core import db
+from par_core.batch import redact_parallel
+from par_core.db import AuditWriter, read_operation
+
+def _tree(tmp_path: Path, n: int):
+    src = tmp_path / "in"; src.mkdir()
+    files = []
+    for i in range(n):
+        f = src / f"f{i}.txt"
+        f.write_text(f"line {i} contact{i}@example.com\n" * (1 + (n - i) * 50), encoding="utf-8")
+        files.append(f)
+    return files
+
+def test_redact_parallel_input_order(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = _tree(tmp_path, 6)
+    out = tmp_path / "out"; out.mkdir()
+    audit = AuditWriter()
+    res = list(redact_parallel(((f, out / f.name) for f in files), jobs=2, plugins_dir=tmp_path, commit_every=4, audit=audit))
+    assert [p for p, _ in res] == files
+    ops = [read_operation(r["op_id"])["operation"] for _, r in res]
+    assert [o["meta"]["seq"] for o in ops] == list(range(6))
+    assert all(b["prev_chain_hash"] == a["chain_hash"] for a, b in zip(ops, ops[1:]))
+    assert "contact0@example.com" not in (out / "f0.txt").read_text(encoding="utf-8")
+    audit.close()
+
+def test_pipeline_stages_report(tmp_path: Path, monkeypatch):
+    from par_core.pipeline import run_pipeline
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = _tree(tmp_path, 5)
+    out = tmp_path / "out"; out.mkdir()
+    audit = AuditWriter()
+    seen = {}
+    report = run_pipeline(((f, out / f.name) for f in files), on_result=lambda p, r: seen.setdefault(p, r),
+                          jobs=2, queue_size=2, plugins_dir=tmp_path, commit_every=2, audit=audit)
+    assert set(seen) == set(files)
+    assert {n: s["items"] for n, s in report["stages"].items()} == {"read": 5, "detect": 5, "write": 5, "audit": 5}
+    assert all(s["max_queue_depth"] <= 2 for s in report["stages"].values())
+    ops = [read_operation(r["op_id"])["operation"] for r in sorted(seen.values(), key=lambda r: r["op_id"])]
+    assert all(b["prev_chain_hash"] == a["chain_hash"] for a, b in zip(ops, ops[1:]))
+    assert "contact3@example.com" not in (out / "f3.txt").read_text(encoding="utf-8")
+    audit.close()
+
+def test_pipeline_audit_failure_skips_only_the_culprit(tmp_path: Path, monkeypatch):
+    from par_core.pipeline import run_pipeline
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = _tree(tmp_path, 5)
+    out = tmp_path / "out"; out.mkdir()
+    audit = AuditWriter()
+    record_many = audit.record_many
+    def record_many_failing(ops):
+        if any(op["file_path"] == str(files[2]) for op in ops):
+            raise RuntimeError("disk full")
+        return record_many(ops)
+    monkeypatch.setattr(audit, "record_many", record_many_failing)
+    seen = {}
+    report = run_pipeline(((f, out / f.name) for f in files), on_result=lambda p, r: seen.setdefault(p, r),
+                          jobs=2, plugins_dir=tmp_path, commit_every=5, audit=audit)
+    assert set(seen) == set(files)
+    assert "disk full" in seen[files[2]]["error"] and seen[files[2]]["output"] == out / files[2].name
+    assert all("op_id" in seen[f] for f in files if f != files[2])
+    assert report["stages"]["audit"]["items"] == 4 and report["stages"]["audit"]["errors"] == 1
+    audit.close()
+
+def test_lpt_plan_and_sharded_output_matches_single_pass(tmp_path: Path, monkeypatch):
+    from par_core.batch import plan_lpt, read_shard
+    from par_core.service import Redactor
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = _tree(tmp_path, 4)
+    big = files[0]
+    big.write_text("".join(f"第{i}行 电话 1380013{i:04d} mail{i}@example.com\r\n" for i in range(400)), encoding="utf-8")
+    size = big.stat().st_size
+    tasks = plan_lpt([(f, f) for f in files], jobs=2, shard_bytes=size // 3)
+    assert [t["seq"] for t in tasks[:4]] == [0, 0, 0, 0] and tasks[0]["shards"] == 4
+    assert [t["cost"] for t in tasks] == sorted((t["cost"] for t in tasks), reverse=True)
+    assert "".join(read_shard(str(big), t["start"], t["end"]) for t in tasks[:4]) == big.read_text(encoding="utf-8")
+
+    out = tmp_path / "out"; out.mkdir()
+    audit = AuditWriter()
+    res = dict(redact_parallel(((f, out / f.name) for f in files), jobs=2, plugins_dir=tmp_path, audit=audit,
+                               schedule="lpt", shard_bytes=size // 3))
+    (findings, redacted), = Redactor(plugins_dir=tmp_path, audit=audit).redact_many([big.read_text(encoding="utf-8")])
+    assert (out / big.name).read_text(encoding="utf-8") == redacted
+    assert [f["span"] for f in res[big]["findings"]] == [f["span"] for f in findings]
+    assert ".txt" in db.throughput_by_suffix()
+    audit.close()
+
+def test_redact_parallel_dedupes_identical_inputs(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = _tree(tmp_path, 3)
+    for i in range(3, 6):
+        f = files[0].parent / f"f{i}.txt"
+        f.write_bytes(files[i % 2].read_bytes())
+        files.append(f)
+    out = tmp_path / "out"; out.mkdir()
+    audit = AuditWriter()
+    res = dict(redact_parallel(((f, out / f.name) for f in files), jobs=2, plugins_dir=tmp_path, audit=audit, dedupe=True))
+    assert set(res) == set(files)
+    for i in range(3, 6):
+        dup, orig = res[files[i]], res[files[i % 2]]
+        assert dup["duplicate_of"] == orig["op_id"]
+        assert (out / files[i].name).read_text(encoding="utf-8") == (out / files[i % 2].name).read_text(encoding="utf-8")
+        rec = read_operation(dup["op_id"])
+        assert rec["snapshots"] == {} and rec["operation"]["meta"]["duplicate_of"] == orig["op_id"]
+        assert rec["operation"]["after_hash"] == read_operation(orig["op_id"])["operation"]["after_hash"]
+    ops = [read_operation(i)["operation"] for i in sorted(r["op_id"] for r in res.values())]
+    assert all(b["prev_chain_hash"] == a["chain_hash"] for a, b in zip(ops, ops[1:]))
+    audit.close()
+
+def test_workers_apply_the_plugin_budget_and_report_metrics(tmp_path: Path, monkeypatch):
+    from par_core.utils.metrics import PLUGIN_METRICS
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    plugins = tmp_path / "plugins"; plugins.mkdir()
+    (plugins / "slow.py").write_text("import time\ndef detect(text):\n    time.sleep(0.02)\n    return []\n", encoding="utf-8")
+    files = _tree(tmp_path, 3)
+    out = tmp_path / "out"; out.mkdir()
+    audit = AuditWriter()
+    PLUGIN_METRICS.reset()
+    PLUGIN_METRICS.configure(0.001, "skip")
+    try:
+        list(redact_parallel(((f, out / f.name) for f in files), jobs=1, plugins_dir=plugins, audit=audit))
+        snap = PLUGIN_METRICS.snapshot()
+    finally:
+        PLUGIN_METRICS.configure()
+        PLUGIN_METRICS.reset()
+        audit.close()
+    slow = snap["plugins"]["slow.detect"]
+    assert slow["calls"] == 1 and slow["over_budget"] == 1 and slow["skipped"] == 2  # skipped in the worker
+    assert snap["disabled"] == ["slow"]
+
+def test_lpt_in_input_order_submits_the_awaited_input_early(tmp_path: Path, monkeypatch):
+    from par_core import batch
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    src = tmp_path / "in"; src.mkdir()
+    files = []
+    for i in range(12):  # the smallest input comes first, so LPT alone would submit it last
+        f = src / f"f{i}.txt"; f.write_text(f"line {i} contact{i}@example.com\n" * (10 + i * 20), encoding="utf-8"); files.append(f)
+    submitted = []
+    make_pool = batch.make_process_pool
+    class Logged:
+        def __init__(self, ex): self.ex = ex
+        def __enter__(self): return self
+        def __exit__(self, *exc): return self.ex.__exit__(*exc)
+        def submit(self, fn, *args):
+            submitted.append(args[0])
+            return self.ex.submit(fn, *args)
+    monkeypatch.setattr(batch, "make_process_pool", lambda *a: Logged(make_pool(*a)))
+    out = tmp_path / "out"; out.mkdir()
+    audit = AuditWriter()
+    res = list(redact_parallel(((f, out / f.name) for f in files), jobs=1, plugins_dir=tmp_path, audit=audit,
+                               schedule="lpt", use_history=False))
+    assert [p for p, _ in res] == files and sorted(submitted) == list(range(12))
+    assert submitted[:4] == [11, 10, 9, 8] and submitted.index(0) == 4  # window of 4, then the head of the line
+    audit.close()
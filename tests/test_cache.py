@@ -0,0 +1,68 @@
+import os
+from pathlib import Path
+from par_core import db
+from par_core.cache import ResultCache
+from par_core.db import AuditWriter, read_operation
+from par_core.service import Redactor
+
+def test_cache_skips_unchanged_files(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    a.write_text("mail alice@example.com", encoding="utf-8")
+    b.write_text("mail bob@example.com", encoding="utf-8")
+    audit, cache = AuditWriter(), ResultCache()
+    r = Redactor(plugins_dir=tmp_path, audit=audit, cache=cache)
+    first = dict(r.process_many([a, b]))
+    second = dict(r.process_many([a, b]))
+    assert cache.hits == 2
+    assert second[a]["cached"] and second[a]["redacted"] == first[a]["redacted"] and second[a]["diff"] is None
+    op = read_operation(second[a]["op_id"])
+    assert op["operation"]["action"] == "reuse" and op["operation"]["meta"]["reused_from"] == first[a]["op_id"]
+    assert op["snapshots"] == {}
+
+    st = a.stat()
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))  # touched, same content
+    b.write_text("mail carol@example.com", encoding="utf-8")
+    third = dict(r.process_many([a, b]))
+    assert third[a]["cached"] and third[a]["diff"] is not None
+    assert not third[b].get("cached") and "carol" not in third[b]["redacted"]
+
+    r_none = Redactor(plugins_dir=tmp_path, audit=audit, cache=ResultCache(reuse_audit="none"))
+    (_, res), = r_none.process_many([b])
+    assert res["cached"] and res["op_id"] is None
+    audit.close(); cache.close()
+
+def test_file_changed_between_read_and_remember_is_read_again(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    a = tmp_path / "a.txt"
+    a.write_text("mail alice@example.com", encoding="utf-8")
+    audit, cache = AuditWriter(), ResultCache()
+    r = Redactor(plugins_dir=tmp_path, audit=audit, cache=cache)
+    record_many = audit.record_many
+    def edit_then_record(ops):
+        a.write_text("mail mallory@example.com, longer", encoding="utf-8")  # lands after read(), before remember()
+        return record_many(ops)
+    monkeypatch.setattr(audit, "record_many", edit_then_record)
+    (_, first), = r.process_many([a])
+    assert "alice" not in first["redacted"]
+    monkeypatch.setattr(audit, "record_many", record_many)
+    content_hash, text, _ = cache.read(a)
+    assert text is not None and "mallory" in text
+    (_, second), = r.process_many([a])
+    assert not second.get("cached") and "mallory" not in second["redacted"]
+    audit.close(); cache.close()
+
+def test_full_cache_hits_carry_finding_text_when_read(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    a = tmp_path / "a.txt"
+    a.write_text("mail alice@example.com", encoding="utf-8")
+    audit, cache = AuditWriter(), ResultCache()
+    r = Redactor(plugins_dir=tmp_path, audit=audit, cache=cache, result="full")
+    first = r.process_file(a)
+    st = a.stat()
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))  # read again, same content
+    second = r.process_file(a)
+    assert second["cached"] and second["findings"] == first["findings"]
+    third = r.process_file(a)  # recognised by its stat, not read
+    assert third["cached"] and third["diff"] is None and all("text" not in f for f in third["findings"])
+    audit.close(); cache.close()
@@ -0,0 +1,236 @@
+import random, sqlite3, zlib
+from pathlib import Path
+import pytest
+from par_core import db
+from par_core.db import AuditWriter, get_manager, read_operation
+
+def test_connection_manager_shares_writer_and_versions_schema(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    op_id, _ = db.record_operation("u", "redact", "a.txt", "a@b.com", "*@b.com", {})
+    a, b = AuditWriter(), AuditWriter()
+    a.record("u", "redact", "b.txt", "x", "y", {}); b.record("u", "redact", "c.txt", "x", "y", {})
+    m = get_manager()
+    assert m.writer() is get_manager(tmp_path / "audit.sqlite3").writer()
+    assert m.writer().execute("PRAGMA user_version;").fetchone()[0] == db.SCHEMA_VERSION
+    with m.reader() as con:
+        assert con.execute("SELECT COUNT(*) FROM operations;").fetchone()[0] == 3
+        with pytest.raises(sqlite3.OperationalError):
+            con.execute("DELETE FROM operations;")
+    assert read_operation(op_id)["snapshots"]["after"] == "*@b.com"
+    # a failing COMMIT is rolled back instead of leaving the writer mid-transaction
+    m.writer().execute("PRAGMA foreign_keys=ON;")
+    with pytest.raises(sqlite3.IntegrityError):
+        with m.transaction() as con:
+            con.execute("PRAGMA defer_foreign_keys=ON;")
+            con.execute("INSERT INTO snapshots (op_id, kind, blob_hash) VALUES (999, 'before', 'nope');")
+    m.writer().execute("PRAGMA foreign_keys=OFF;")
+    assert not m.writer().in_transaction
+    a.record("u", "redact", "d.txt", "x", "y", {})
+    assert db.verify_chain()["ok"]
+    m.writer().execute(f"PRAGMA user_version={db.SCHEMA_VERSION + 1};")
+    m.close()
+    with pytest.raises(RuntimeError):
+        m.writer()
+
+def test_grouped_writer_commits_in_groups_and_keeps_chain(tmp_path: Path, monkeypatch):
+    import threading
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    w = AuditWriter(durability="grouped", group_size=16, group_ms=200)
+    futures = []
+    def work(t):
+        for i in range(20):
+            futures.append(w.submit(user="u", action="redact", file_path=f"{t}-{i}.txt", before_text=f"{t}{i}", after_text="x", meta={}))
+    threads = [threading.Thread(target=work, args=(t,)) for t in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    w.flush()
+    assert all(f.done() for f in futures)
+    ids = sorted(f.result()[0] for f in futures)
+    assert ids == list(range(1, 81))
+    assert w.record("u", "redact", "last.txt", "a", "b", {})[0] == 81
+    assert [r[0] for r in w.record_many([dict(user="u", action="redact", file_path="m.txt", before_text="a", after_text="b", meta={})] * 3)] == [82, 83, 84]
+    ops = [read_operation(i)["operation"] for i in range(1, 85)]
+    assert all(b["prev_chain_hash"] == a["chain_hash"] for a, b in zip(ops, ops[1:]))
+    w.close()
+    assert AuditWriter(durability="strict").submit(user="u", action="redact", file_path="s.txt", before_text="a", after_text="b", meta={}).result()[0] == 85
+
+def test_concurrent_writer_processes_keep_one_chain(tmp_path: Path):
+    from par_core.bench import stress_appends
+    res = stress_appends(tmp_path / "stress.sqlite3", writers=4, ops=40, group=1)
+    assert res["failed_writers"] == 0
+    assert res["ok"] and res["count"] == res["expected"] == 160
+    con = sqlite3.connect(str(tmp_path / "stress.sqlite3"))
+    con.execute("UPDATE operations SET user='mallory' WHERE id=50;"); con.commit(); con.close()
+    bad = db.verify_chain(tmp_path / "stress.sqlite3")
+    assert not bad["ok"] and bad["errors"][0] == {"id": 50, "error": "hash mismatch"}
+
+def test_migration_adds_indexes_and_query_pages(tmp_path: Path, monkeypatch):
+    path = tmp_path / "old.sqlite3"
+    con = sqlite3.connect(str(path)); con.executescript(db.SCHEMA); con.close()  # pre-versioning DB
+    monkeypatch.setattr(db, "DB_PATH", path)
+    w = AuditWriter()
+    w.record_many([dict(user=f"u{i % 3}", action="redact", file_path=f"f{i % 4}.txt", before_text=f"t{i}", after_text="x", meta={})
+                   for i in range(30)])
+    con = get_manager().writer()
+    assert con.execute("PRAGMA user_version;").fetchone()[0] == db.SCHEMA_VERSION
+    plan = " ".join(str(r) for r in con.execute("EXPLAIN QUERY PLAN SELECT id FROM operations WHERE user=? ORDER BY id DESC;", ("u1",)))
+    assert "idx_operations_user" in plan
+    seen, cursor = [], None
+    while True:
+        page, cursor = db.query_operations(user="u1", limit=4, cursor=cursor)
+        seen.extend(op["id"] for op in page)
+        if cursor is None:
+            break
+    assert seen == [i + 1 for i in reversed(range(30)) if i % 3 == 1]
+    page, cursor = db.query_operations(file_path="f2.txt", user="u0", newest_first=False)
+    assert [op["id"] for op in page] == [i + 1 for i in range(30) if i % 4 == 2 and i % 3 == 0] and cursor is None
+    first = db.query_operations(limit=1, newest_first=False)[0][0]
+    assert db.query_operations(before_hash=first["before_hash"])[0][0]["id"] == first["id"]
+    timed, cur = db.query_operations(since=first["op_time"], limit=10)
+    assert len(timed) == 10 and cur == timed[-1]["id"]
+    assert len(db.query_operations(since=first["op_time"], limit=100, cursor=cur)[0]) == 20
+
+def test_blob_store_dedupes_migrates_and_collects(tmp_path: Path, monkeypatch):
+    path = tmp_path / "v2.sqlite3"
+    con = sqlite3.connect(str(path)); con.executescript(db.SCHEMA + db.INDEXES)
+    for op_id, kind, text in [(1, "before", "same"), (1, "after", "s***"), (2, "before", "same"), (2, "after", "s***")]:
+        con.execute("INSERT INTO operations (id, op_time, action) VALUES (?, '', 'redact') ON CONFLICT DO NOTHING;", (op_id,))
+        con.execute("INSERT INTO snapshots (op_id, kind, content) VALUES (?,?,?);", (op_id, kind, zlib.compress(text.encode())))
+    con.execute("PRAGMA user_version=2;"); con.commit(); con.close()
+    monkeypatch.setattr(db, "DB_PATH", path)
+    assert read_operation(2)["snapshots"] == {"before": "same", "after": "s***"}
+    op_id, _ = db.record_operation("u", "redact", "a.txt", "same", "other", {})
+    con = get_manager().writer()
+    assert con.execute("SELECT COUNT(*) FROM blobs;").fetchone()[0] == 3
+    assert con.execute("SELECT refcount FROM blobs WHERE hash=?;", (db._hash_bytes(b"same"),)).fetchone()[0] == 3
+    assert db.read_snapshot(op_id, "after") == "other"
+    assert db.prune_snapshots(op_id) == 4
+    assert db.gc_blobs() == {"deleted": 1, "deleted_chunks": 0, "deleted_zdicts": 0, "freed_bytes": len(zlib.compress(b"s***")), "recounted": 0}
+    con.execute("UPDATE blobs SET refcount=7;")
+    assert db.gc_blobs()["recounted"] == 2
+    assert read_operation(op_id)["snapshots"] == {"before": "same", "after": "other"} and read_operation(1)["snapshots"] == {}
+
+def test_after_snapshot_is_delta_with_full_fallback(tmp_path: Path, monkeypatch):
+    from par_core.service import build_op
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    text = "contact alice@example.com or 13800138000\n" * 50
+    findings = [{"type": "email", "span": (8, 25)}, {"type": "phone_cn", "span": (29, 40)}]
+    from par_core.transformers.redact import redact
+    redacted = redact(text, findings)
+    w = AuditWriter()
+    op_id, _ = w.record(**build_op("u", "smart", "a.txt", text, findings, redacted))
+    transformed, _ = w.record(**build_op("u", "smart", "b.txt", text + "!", findings, redacted.upper()))
+    con = get_manager().writer()
+    enc = dict(con.execute("SELECT s.op_id || s.kind, b.encoding FROM snapshots s JOIN blobs b ON b.hash=s.blob_hash;"))
+    assert enc == {f"{op_id}before": "full", f"{op_id}after": "delta", f"{transformed}before": "full", f"{transformed}after": "full"}
+    assert read_operation(op_id)["snapshots"]["after"] == redacted
+    assert db.read_snapshot(transformed, "after") == redacted.upper()
+    assert db.prune_snapshots(transformed) == 2 and db.gc_blobs()["deleted"] == 2  # the delta, then its base
+    assert db.read_snapshot(transformed, "before") == text + "!"
+    w.record(**build_op("u", "smart", "a.txt", text, findings, redacted))
+    con.execute("UPDATE blobs SET content=? WHERE encoding='delta';", (zlib.compress(b'[[8, 17, "x"]]'),))
+    with pytest.raises(ValueError):
+        db.read_snapshot(transformed + 1, "after")
+
+def test_dense_findings_never_store_a_delta_larger_than_the_text(tmp_path: Path, monkeypatch):
+    from par_core.detectors.patterns import find_pii
+    from par_core.service import build_op
+    from par_core.transformers.redact import redact
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    w = AuditWriter()
+    text = "".join(f"{i:05d} login alice{i}@example.com 13800{i:06d} 10.0.{i % 256}.1\n" for i in range(300))
+    findings = find_pii(text)
+    op_id, _ = w.record(**build_op("u", "smart", "auth.log", text, findings, redact(text, findings)))
+    after = read_operation(op_id)["snapshots"]["after"]
+    encoding, stored = get_manager().writer().execute(
+        "SELECT b.encoding, LENGTH(b.content) FROM snapshots s JOIN blobs b ON b.hash=s.blob_hash WHERE s.op_id=? AND s.kind='after';",
+        (op_id,)).fetchone()
+    assert encoding == "full" and stored <= len(zlib.compress(after.encode()))
+
+def test_chunked_backend_shares_chunks_between_versions(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    w = AuditWriter(backend="chunked")
+    log = "".join(f"{i:06d} 请求 user{i}@example.com ok\n" for i in range(4000))
+    grown = log + "".join(f"{i:06d} 请求 late ok\n" for i in range(100))
+    first, _ = w.record("u", "redact", "app.log", log, "x", {})
+    second, _ = w.record("u", "redact", "app.log", grown, "x", {})
+    con = get_manager().writer()
+    per_blob = dict(con.execute("SELECT blob_hash, COUNT(*) FROM blob_chunks GROUP BY blob_hash;"))
+    stored = con.execute("SELECT COUNT(*) FROM chunks;").fetchone()[0]
+    assert len(per_blob) == 2 and stored <= max(per_blob.values()) + 2
+    pieces = list(db.iter_snapshot(second, "before"))
+    assert len(pieces) > 1 and "".join(pieces) == grown
+    idle = len(get_manager()._pool)
+    it = db.iter_snapshot(second, "before")
+    assert next(it) == pieces[0] and len(get_manager()._pool) == idle  # no reader held between pieces
+    it.close()
+    assert read_operation(first)["snapshots"]["before"] == log
+    db.prune_snapshots(second)
+    res = db.gc_blobs()
+    assert res["deleted"] == 1 and 0 < res["deleted_chunks"] <= 2
+    assert db.read_snapshot(second, "before") == grown
+
+def test_codecs_and_trained_zdict(tmp_path: Path, monkeypatch):
+    from par_core.detectors.patterns import find_pii
+    from par_core.service import redact_texts
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    docs = [f"2024-05-{i % 28 + 1:02d} INFO gateway request accepted for tenant acme, status=ok latency={i}ms\n"
+            f"2024-05-{i % 28 + 1:02d} WARN gateway login by user{i}.smith@corp-mail.com from 10.0.{i}.7 rejected\n" for i in range(40)]
+    plain = AuditWriter()
+    ids = [plain.record("u", "redact", f"{i}.log", d, redacted, findings)[0]
+           for i, (d, (findings, redacted)) in enumerate(zip(docs, redact_texts(docs)))]
+    for name in db.CODECS:
+        assert db.compression.decompress(name, db.compression.compress(name, docs[0].encode(), b"gateway"), b"gateway") == docs[0].encode()
+    assert db.train_zdict() == 1
+    con = get_manager().writer()
+    zdict = con.execute("SELECT content FROM zdicts WHERE id=1;").fetchone()[0]
+    assert b"gateway request accepted" in zdict
+    secrets = {f["text"] for d in docs for f in find_pii(d)}
+    assert secrets and not [s for s in secrets if s.encode() in zdict]
+    text = docs[0].replace("INFO", "DEBUG")
+    dicted = AuditWriter(codec="zlib-dict")
+    new_id, _ = dicted.record("u", "redact", "new.log", text, "x", {})
+    codec, dict_id, size = con.execute("SELECT codec, dict_id, LENGTH(content) FROM blobs WHERE hash=?;",
+                                       (db._hash_bytes(text.encode()),)).fetchone()
+    assert (codec, dict_id) == ("zlib-dict", 1) and size < len(zlib.compress(text.encode()))
+    assert db.read_snapshot(new_id, "before") == text and db.read_snapshot(ids[3], "before") == docs[3]
+    with pytest.raises(ValueError):
+        AuditWriter(codec="zstd")
+    # a dictionary nothing refers to is collected; the newest one only on request
+    assert db.train_zdict() == 2
+    assert db.gc_blobs()["deleted_zdicts"] == 0  # 1 is still used by new.log, 2 is the newest
+    db.prune_snapshots(new_id + 1)
+    assert db.gc_blobs()["deleted_zdicts"] == 1
+    assert db.gc_blobs(keep_latest_zdict=False)["deleted_zdicts"] == 1
+    assert con.execute("SELECT COUNT(*) FROM zdicts;").fetchone()[0] == 0
+
+def test_prepared_ops_stream_and_recover_from_stale_state(tmp_path: Path, monkeypatch):
+    import hashlib
+    from par_core.detectors.patterns import find_pii
+    from par_core.service import build_op
+    from par_core.transformers.redact import redact
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    monkeypatch.setattr(db, "STREAM_CHARS", 1000)
+    w = AuditWriter(backend="chunked")
+    def op(text):
+        findings = find_pii(text)
+        return build_op("u", "smart", "app.log", text, findings, redact(text, findings))
+    rnd, words = random.Random(7), "alpha beta gamma kappa sigma omega north south river stone cloud 数据".split()
+    text = "".join(" ".join(rnd.choice(words) for _ in range(6)) + (f" user{i}@example.com\n" if i % 10 == 0 else "\n")
+                   for i in range(600))  # sparse findings in varied text: the delta beats the text itself
+    prepped = w.prepare(op(text)).result()
+    assert prepped["before_hash"] == hashlib.sha256(text.encode()).hexdigest()
+    assert prepped["prepared"]["before"]["encoding"] == "chunked" and prepped["prepared"]["after"]["encoding"] == "delta"
+    first, _ = w.record(**prepped)
+    again = w.prepare(op(text)).result()
+    assert again["prepared"]["before"]["encoding"] is None
+    w.record(**again)
+    grown = text + "数据 tail ok\n"
+    stale = w.prepare(op(grown)).result()
+    assert any(packed is None for _, _, packed in stale["prepared"]["before"]["chunks"])
+    db.prune_snapshots(first + 2)
+    assert db.gc_blobs()["deleted_chunks"] > 0
+    op_id, _ = w.record(**stale)
+    assert read_operation(op_id)["snapshots"]["before"] == grown
+    assert db.read_snapshot(op_id, "after") == op(grown)["after_text"]
+    w.close()
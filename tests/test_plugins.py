@@ -0,0 +1,171 @@
+from pathlib import Path
+from par_core.detectors.patterns import dedupe_findings, find_pii
+from par_core.transformers.redact import redact_spans
+from par_core.utils.misc import load_plugins, plugin_rules, apply_plugin_detectors, apply_plugin_detectors_many, apply_plugin_replacements, apply_plugin_transformers
+
+PLUGINS = Path(__file__).resolve().parents[1] / "plugins"
+
+def test_span_replacements_single_pass():
+    text = "住址：北京市朝阳区酒仙桥路10号，邮箱 a@b.com"
+    plugins = load_plugins(PLUGINS)
+    findings = dedupe_findings(find_pii(text, plugin_rules(plugins)) + apply_plugin_detectors(plugins, text))
+    apply_plugin_replacements(plugins, findings)
+    redacted, shifted = redact_spans(text, findings)
+    assert "[地址已脱敏]" in redacted and "北京市" not in redacted
+    for f in shifted:
+        s, e = f["span"]
+        assert f["type"] != "address_cn" or redacted[s:e] == "[地址已脱敏]"
+
+def test_span_diff_matches_difflib():
+    import random
+    from par_core.utils.misc import iter_redaction_diff, iter_text_diff
+    rng = random.Random(5)
+    pieces = ["plain", "call 13800138000", "mail a.b@example.com", "", "住址：北京市朝阳区酒仙桥路10号", "+86 13912345678"]
+    plugins = load_plugins(PLUGINS)
+    for _ in range(100):
+        text = "\n".join(rng.choice(pieces) for _ in range(rng.randint(0, 40))) + rng.choice(["", "\n"])
+        findings = dedupe_findings(find_pii(text, plugin_rules(plugins)) + apply_plugin_detectors(plugins, text))
+        apply_plugin_replacements(plugins, findings)
+        for f in findings:
+            if rng.random() < 0.3:
+                f["replacement"] = ""  # deletions, sometimes emptying a line
+        redacted, _ = redact_spans(text, findings)
+        assert list(iter_redaction_diff(text, redacted, findings)) == list(iter_text_diff(text, redacted))
+    # deleting the last line, or a span that eats the final "\n"
+    long_text = "".join(f"line {i}\n" for i in range(27)) + "secret\n"
+    for text, span in [("keep\nsecret", (5, 11)), ("keep\nsecret\n", (5, 11)), ("secret", (0, 6)),
+                       (long_text, (len(long_text) - 7, len(long_text))), ("keep\nsecret\nend", (5, 12))]:
+        findings = [{"type": "t", "span": span, "replacement": ""}]
+        redacted, _ = redact_spans(text, findings)
+        assert list(iter_redaction_diff(text, redacted, findings)) == list(iter_text_diff(text, redacted))
+    # text rewritten after redaction: falls back to difflib
+    text = "mail a.b@example.com\nok\n"
+    findings = find_pii(text)
+    changed = redact_spans(text, findings)[0].upper()
+    assert list(iter_redaction_diff(text, changed, findings)) == list(iter_text_diff(text, changed))
+    # other line breaks str.splitlines() splits on
+    for text in ["call 13800138000\r\nok\r\nmail a.b@example.com\r\n", "ok\u2028call 13800138000\u2028ok\nmail a.b@example.com"]:
+        findings = find_pii(text)
+        redacted, _ = redact_spans(text, findings)
+        assert list(iter_redaction_diff(text, redacted, findings)) == list(iter_text_diff(text, redacted))
+
+def test_legacy_transform_sees_shifted_spans(tmp_path: Path):
+    (tmp_path / "legacy.py").write_text(
+        "def transform(text, findings):\n"
+        "    for f in findings:\n"
+        "        s, e = f['span']\n"
+        "        text = text[:s] + text[s:e].upper() + text[e:]\n"
+        "    return text\n", encoding="utf-8")
+    text = "x abc y def"
+    findings = [{"type": "t", "span": (2, 5), "text": "abc", "replacement": "<long>"},
+                {"type": "t", "span": (8, 11), "text": "def", "replacement": "zz"}]
+    redacted, shifted = redact_spans(text, findings)
+    assert redacted == "x <long> y zz"
+    assert apply_plugin_transformers(load_plugins(tmp_path), redacted, shifted) == "x <LONG> y ZZ"
+
+def test_registry_caches_and_hot_reloads(tmp_path: Path):
+    from par_core.utils.misc import PluginRegistry
+    py = tmp_path / "p.py"
+    py.write_text("VERSION = 1\n", encoding="utf-8")
+    reg = PluginRegistry(check_interval=0)
+    first = reg.get(tmp_path)
+    assert reg.get(tmp_path)[0] is first[0]
+    py.write_text("VERSION = 22\n", encoding="utf-8")
+    second = reg.get(tmp_path)
+    assert second[0].VERSION == 22 and first[0].VERSION == 1
+    py.write_text("raise RuntimeError('broken')\n", encoding="utf-8")
+    assert reg.get(tmp_path)[0] is second[0]
+
+def test_declarative_rules_from_sidecar_csv(tmp_path: Path):
+    (tmp_path / "emp.py").write_text("RULES = [{'name': 'emp_id', 'regex': r'EMP-\\d{5}'}]\n", encoding="utf-8")
+    (tmp_path / "emp.csv").write_text("name,regex,example,description\nbadge,BDG\\d{4},BDG1234,badge\n", encoding="utf-8")
+    rules = plugin_rules(load_plugins(tmp_path))
+    types = {f["type"] for f in find_pii("EMP-12345 BDG9876", rules)}
+    assert {"emp_id", "badge"} <= types
+
+def test_detect_many_batches_map_back(tmp_path: Path):
+    (tmp_path / "bulk.py").write_text(
+        "BATCH_SIZE = 2\n"
+        "CALLS = []\n"
+        "def detect_many(texts):\n"
+        "    CALLS.append(len(texts))\n"
+        "    return [[{'type': 'word', 'span': (0, len(t)), 'text': t}] for t in texts]\n", encoding="utf-8")
+    plugins = load_plugins(tmp_path)
+    res = apply_plugin_detectors_many(plugins, ["a", "bb", "ccc"])
+    assert [r[0]["text"] for r in res] == ["a", "bb", "ccc"]
+    assert plugins[0].CALLS == [2, 1]
+
+def test_plugin_metrics_and_skip_budget(tmp_path: Path):
+    from par_core.utils.metrics import PLUGIN_METRICS
+    (tmp_path / "slow.py").write_text(
+        "import time\n"
+        "TIME_BUDGET = 0.001\n"
+        "def detect(text):\n"
+        "    time.sleep(0.01)\n"
+        "    return []\n", encoding="utf-8")
+    (tmp_path / "bad.py").write_text("def detect(text):\n    raise ValueError('boom')\n", encoding="utf-8")
+    PLUGIN_METRICS.reset()
+    PLUGIN_METRICS.configure(policy="skip")
+    try:
+        apply_plugin_detectors_many(load_plugins(tmp_path), ["abc", "def"])
+        snap = PLUGIN_METRICS.snapshot()
+    finally:
+        PLUGIN_METRICS.configure()
+        PLUGIN_METRICS.reset()
+    slow, bad = snap["plugins"]["slow.detect"], snap["plugins"]["bad.detect"]
+    assert slow["calls"] == 1 and slow["over_budget"] == 1 and slow["skipped"] == 1
+    assert bad["errors"] == 2 and bad["bytes"] == 6
+    assert snap["disabled"] == ["slow"]
+
+def test_pool_plugin_latency_excludes_core_detection(tmp_path: Path):
+    import time
+    from par_core.utils.metrics import PLUGIN_METRICS
+    from par_core.utils.misc import start_plugin_detectors
+    from par_core.utils.pool import PluginPool
+    (tmp_path / "quick.py").write_text("def detect(text):\n    return []\n", encoding="utf-8")
+    pool = PluginPool(tmp_path)
+    PLUGIN_METRICS.reset()
+    PLUGIN_METRICS.configure(0.2, "skip")
+    try:
+        (proxy,) = pool.plugins
+        for _ in range(2):
+            collect = start_plugin_detectors([proxy], ["abc"])
+            time.sleep(0.3)  # core detection, slower than the budget
+            assert collect() == [[]]
+        snap = PLUGIN_METRICS.snapshot()
+    finally:
+        PLUGIN_METRICS.configure()
+        PLUGIN_METRICS.reset()
+        pool.close()
+    quick = snap["plugins"]["quick.detect_many"]
+    assert quick["calls"] == 2 and quick["over_budget"] == 0 and quick["skipped"] == 0 and quick["p99_ms"] < 200
+    assert snap["disabled"] == []
+
+def test_plugin_pool_timeout_and_restart(tmp_path: Path):
+    from par_core.utils.misc import start_plugin_detectors
+    from par_core.utils.pool import PluginPool
+    (tmp_path / "emp.py").write_text(
+        "import re, time\n"
+        "RULES = [{'name': 'emp_id', 'regex': re.compile(r'EMP-\\d{5}')}]\n"
+        "def detect(text):\n"
+        "    if 'SLOW' in text:\n"
+        "        time.sleep(5)\n"
+        "    return [{'type': 'kw', 'span': (0, 3), 'text': text[:3]}]\n"
+        "def replace(f):\n"
+        "    return '<' + f['type'] + '>'\n", encoding="utf-8")
+    pool = PluginPool(tmp_path, timeout=0.5)
+    try:
+        (proxy,) = pool.plugins
+        assert proxy.RULES[0]["name"] == "emp_id"
+        assert start_plugin_detectors([proxy], ["abc", "defg"])() == [
+            [{"type": "kw", "span": (0, 3), "text": "abc"}], [{"type": "kw", "span": (0, 3), "text": "def"}]]
+        start_plugin_detectors([proxy], ["never collected"])  # e.g. core detection raised before collect()
+        assert apply_plugin_detectors([proxy], "abc")[0]["text"] == "abc"
+        assert apply_plugin_detectors([proxy], "SLOW") == []
+        assert apply_plugin_detectors([proxy], "xyz")[0]["text"] == "xyz"
+        assert pool.stats()["emp"]["restarts"] == 1
+        findings = [{"type": "kw", "span": (0, 3), "text": "xyz"}]
+        apply_plugin_replacements([proxy], findings)
+        assert findings[0]["replacement"] == "<kw>"
+    finally:
+        pool.close()
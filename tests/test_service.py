@@ -0,0 +1,161 @@
+import sqlite3, threading
+import pytest
+from pathlib import Path
+from par_core import db
+from par_core.db import AuditWriter, read_operation
+from par_core.service import Redactor
+
+def test_redactor_shared_across_threads(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    r = Redactor(plugins_dir=tmp_path, audit=AuditWriter())
+    results = []
+    def work(i):
+        results.append(r.process_text(f"mail{i}@example.com", file_path=f"f{i}.txt"))
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert sorted(x["op_id"] for x in results) == list(range(1, 9))
+    op = read_operation(8)
+    assert op["snapshots"]["before"] in {f"mail{i}@example.com" for i in range(8)}
+    r.audit.close()
+
+def test_process_many_groups_commits_and_keeps_chain(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = []
+    for i in range(5):
+        f = tmp_path / f"f{i}.txt"; f.write_text(f"user{i}@example.com", encoding="utf-8"); files.append(f)
+    files.insert(2, tmp_path / "missing.txt")
+    audit = AuditWriter()
+    r = Redactor(plugins_dir=tmp_path, audit=audit, batch_size=4)
+    out = list(r.process_many(files, commit_every=2, skip_errors=True))
+    assert [p for p, _ in out] == files
+    assert "error" in out[2][1]
+    ops = [read_operation(res["op_id"])["operation"] for _, res in out if "op_id" in res]
+    assert [o["file_path"] for o in ops] == [str(f) for f in files if f.name != "missing.txt"]
+    assert all(b["prev_chain_hash"] == a["chain_hash"] for a, b in zip(ops, ops[1:]))
+    # snapshots are prepared in threads only when asked for
+    calls = []
+    prepare = audit.prepare
+    monkeypatch.setattr(audit, "prepare", lambda op: calls.append(op) or prepare(op))
+    list(r.process_many(files, commit_every=2, skip_errors=True))
+    assert calls == []
+    out = list(Redactor(plugins_dir=tmp_path, audit=audit, batch_size=4, prepare=True).process_many(files, commit_every=2, skip_errors=True))
+    assert len(calls) == 5 and read_operation(out[-1][1]["op_id"])["snapshots"]["before"] == "user4@example.com"
+    audit.close()
+
+def _doc(rng, n):
+    pieces = ["plain text line", "call 13800138000 now", "mail a.b@example.com", "id 11010519491231002X ok",
+              "card 4111111111111111", "ip 192.168.1.20 token=abcdef0123456789", "+86 13912345678"]
+    return "".join(f"{i} {rng.choice(pieces)}\n" for i in range(n))
+
+def test_incremental_rescan_matches_full_scan():
+    import random
+    from par_core.detectors.incremental import rescan
+    from par_core.detectors.patterns import find_pii
+    rng = random.Random(7)
+    old = _doc(rng, 400)
+    old_findings = find_pii(old)
+    for _ in range(25):
+        lines = old.splitlines(keepends=True)
+        for _ in range(rng.randint(1, 4)):
+            i = rng.randrange(len(lines))
+            op = rng.choice(["edit", "insert", "delete", "join"])
+            if op == "edit":
+                lines[i] = lines[i][:rng.randrange(len(lines[i]))] + rng.choice(["139", "@x.org", " 4111", "\n"]) + lines[i][rng.randrange(len(lines[i])):]
+            elif op == "insert":
+                lines.insert(i, _doc(rng, 2))
+            elif op == "delete" and len(lines) > 1:
+                del lines[i]
+            else:
+                lines[i] = lines[i].rstrip("\n") + " "
+        new = "".join(lines)
+        found, scanned = rescan(old, old_findings, new, margin=64)
+        full = find_pii(new)
+        assert found is not None and scanned < len(new)
+        assert [(f["type"], f["span"], f["text"]) for f in found] == [(f["type"], f["span"], f["text"]) for f in full]
+
+def test_process_file_rescans_only_changed_regions(tmp_path: Path, monkeypatch):
+    import random
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    f = tmp_path / "doc.txt"
+    text = _doc(random.Random(3), 300)
+    f.write_text(text, encoding="utf-8")
+    r = Redactor(plugins_dir=tmp_path, audit=AuditWriter(), incremental=True)
+    first = r.process_file(f)
+    f.write_text(text.replace("150 ", "150 mail new.addr@example.org ", 1), encoding="utf-8")
+    second = r.process_file(f)
+    meta = read_operation(second["op_id"])["operation"]["meta"]
+    assert meta["incremental"]["base"] == first["op_id"] and meta["incremental"]["rescanned"] < len(text) // 2
+    full = Redactor(plugins_dir=tmp_path, audit=r.audit).process_file(f)
+    assert "incremental" not in read_operation(full["op_id"])["operation"]["meta"]  # off by default
+    assert second["redacted"] == full["redacted"] and "new.addr@example.org" not in second["redacted"]
+    assert [(x["type"], x["span"]) for x in second["findings"]] == [(x["type"], x["span"]) for x in full["findings"]]
+    r.audit.close()
+
+def test_lean_and_stream_results_build_diff_on_demand(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    f = tmp_path / "a.txt"; f.write_text("mail a.b@example.com\ncall 13800138000\n", encoding="utf-8")
+    r = Redactor(plugins_dir=tmp_path, audit=AuditWriter())
+    full = r.process_file(f)
+    lean = r.process_file(f, result="lean")
+    assert "diff" not in lean and lean["redacted"] == full["redacted"]
+    assert lean["findings"] == {t: [x["type"] for x in full["findings"]].count(t) for t in {x["type"] for x in full["findings"]}}
+    assert sum(lean["findings"].values()) == 2
+    assert lean["diff"] == full["diff"] and "diff" in lean
+    stream = r.process_file(f, result="stream")
+    assert "\n".join(stream["diff"]) == full["diff"] == "\n".join(stream.get("diff"))
+    r.audit.close()
+
+def test_skip_errors_covers_detection_and_audit(tmp_path: Path, monkeypatch):
+    from par_core import service
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = []
+    for name in ("a", "boom", "b", "bad", "c"):
+        f = tmp_path / f"{name}.txt"; f.write_text(f"{name} user@example.com", encoding="utf-8"); files.append(f)
+    redact_texts = service.redact_texts
+    def flaky_redact(texts, *args):
+        if any(t.startswith("boom") for t in texts):
+            raise RuntimeError("detector crashed")
+        return redact_texts(texts, *args)
+    monkeypatch.setattr(service, "redact_texts", flaky_redact)
+    audit = AuditWriter()
+    record_many = audit.record_many
+    def flaky_record(ops):
+        if any(op["file_path"].endswith("bad.txt") for op in ops):
+            raise sqlite3.OperationalError("disk I/O error")
+        return record_many(ops)
+    monkeypatch.setattr(audit, "record_many", flaky_record)
+    out = dict(Redactor(plugins_dir=tmp_path, audit=audit).process_many(files, skip_errors=True))
+    assert out[files[1]] == {"error": "detector crashed"} and out[files[3]] == {"error": "disk I/O error"}
+    ops = [read_operation(out[f]["op_id"])["operation"] for f in (files[0], files[2], files[4])]
+    assert all(b["prev_chain_hash"] == a["chain_hash"] for a, b in zip(ops, ops[1:]))
+    with pytest.raises(RuntimeError):
+        list(Redactor(plugins_dir=tmp_path, audit=audit).process_many(files))
+    audit.close()
+
+def test_process_files_forwards_batch_size(tmp_path: Path, monkeypatch):
+    from par_core import service
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = []
+    for i in range(5):
+        f = tmp_path / f"f{i}.txt"; f.write_text(f"user{i}@example.com", encoding="utf-8"); files.append(f)
+    sizes = []
+    redact_texts = service.redact_texts
+    monkeypatch.setattr(service, "redact_texts", lambda texts, *a: sizes.append(len(texts)) or redact_texts(texts, *a))
+    out = list(service.process_files(files, "u", "smart", tmp_path, 2))
+    assert [p for p, _ in out] == files and sizes == [2, 2, 1]
+    list(service.process_files(files, plugins_dir=tmp_path))
+    assert sizes[3:] == [5]
+
+def test_redactor_forwards_durability(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "audit.sqlite3")
+    files = []
+    for i in range(3):
+        f = tmp_path / f"f{i}.txt"; f.write_text(f"user{i}@example.com", encoding="utf-8"); files.append(f)
+    r = Redactor(plugins_dir=tmp_path, durability="grouped")
+    assert r.audit.durability == "grouped"
+    out = list(r.process_many(files, commit_every=2))
+    assert [read_operation(res["op_id"])["operation"]["file_path"] for _, res in out] == [str(f) for f in files]
+    r.audit.close()
+    with pytest.raises(ValueError):
+        Redactor(plugins_dir=tmp_path, durability="lazy")